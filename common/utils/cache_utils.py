@@ -1,5 +1,4 @@
 import json
-import pickle
 import hashlib
 import time
 import functools
@@ -153,17 +152,68 @@ class RedisCache:
             int: 清除的缓存数量
         """
         try:
-            # 获取Redis连接
-            client = cache.client.get_client()
-            keys = client.keys(f"*{cache.key_prefix}:{pattern}*")
-            if keys:
-                client.delete(*keys)
-                return len(keys)
-            return 0
+            # 由django-redis按KEY_PREFIX和版本号拼出实际的键模式，并用SCAN代替阻塞的KEYS
+            return cache.delete_pattern(pattern)
         except Exception as e:
             logger.warning(f"清除缓存模式失败 - 模式:{pattern}, 错误:{str(e)}")
             return 0
 
+    @staticmethod
+    def tag_key(key: str, tags: List[str], timeout: Optional[int] = None) -> bool:
+        """
+        将缓存键登记到标签集合中，便于之后按标签精确失效
+
+        Args:
+            key: 缓存键（未加前缀的逻辑键）
+            tags: 标签列表
+            timeout: 标签集合的过期时间(秒)，None表示使用默认过期时间
+
+        Returns:
+            bool: 是否成功登记
+        """
+        if not tags:
+            return True
+
+        try:
+            client = RedisCache.get_redis_client()
+            expire = timeout or cache.default_timeout
+            pipe = client.pipeline(transaction=False)
+            for tag in tags:
+                tag_key = cache.make_key(f"tag:{tag}")
+                pipe.sadd(tag_key, key)
+                pipe.expire(tag_key, expire)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.warning(f"登记缓存标签失败 - 键:{key}, 错误:{str(e)}")
+            return False
+
+    @staticmethod
+    def invalidate_tag(tag: str) -> int:
+        """
+        删除登记在指定标签下的所有缓存以及标签集合本身
+
+        Args:
+            tag: 标签
+
+        Returns:
+            int: 删除的缓存数量
+        """
+        try:
+            client = RedisCache.get_redis_client()
+            tag_key = cache.make_key(f"tag:{tag}")
+            keys = client.smembers(tag_key)
+
+            pipe = client.pipeline(transaction=False)
+            if keys:
+                pipe.unlink(*[cache.make_key(k.decode() if isinstance(k, bytes) else k) for k in keys])
+            pipe.unlink(tag_key)
+            pipe.execute()
+            return len(keys)
+        except Exception as e:
+            logger.warning(f"按标签清除缓存失败 - 标签:{tag}, 错误:{str(e)}")
+            return 0
+
     @staticmethod
     def get_redis_client():
         """
@@ -213,7 +263,12 @@ class RedisCache:
             raise
 
 
-def cached(prefix: str, timeout: Optional[int] = None, key_func: Optional[Callable] = None):
+def cached(
+    prefix: str,
+    timeout: Optional[int] = None,
+    key_func: Optional[Callable] = None,
+    tags_func: Optional[Callable] = None,
+):
     """
     函数结果缓存装饰器
 
@@ -221,6 +276,7 @@ def cached(prefix: str, timeout: Optional[int] = None, key_func: Optional[Callab
         prefix: 缓存键前缀
         timeout: 过期时间(秒)
         key_func: 自定义键生成函数
+        tags_func: 根据函数结果生成缓存标签的函数，用于RedisCache.invalidate_tag精确失效
 
     Returns:
         装饰器函数
@@ -246,6 +302,8 @@ def cached(prefix: str, timeout: Optional[int] = None, key_func: Optional[Callab
 
                 # 缓存结果
                 RedisCache.set(cache_key, result, timeout)
+                if tags_func:
+                    RedisCache.tag_key(cache_key, tags_func(result), timeout)
                 logger.debug(f"缓存未命中 - 键:{cache_key}, 计算耗时:{duration:.4f}秒")
             else:
                 logger.debug(f"缓存命中 - 键:{cache_key}")
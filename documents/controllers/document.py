@@ -1,3 +1,5 @@
+import uuid
+
 from ninja import Router, File, Query
 from ninja.files import UploadedFile
 from typing import List, Optional
@@ -21,12 +23,19 @@ from documents.tasks import process_document_task, reprocess_document_task
 # 创建路由器
 router = Router(tags=["documents"])
 
+# 文件扩展名到文档类型的映射，未知扩展名按txt处理
+_FILE_TYPE_MAP = {"pdf": "pdf", "docx": "docx", "txt": "txt"}
+
 
 @router.get("/", response=DocumentListOut)
 def list_documents(request, page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=100)):
     """获取当前用户的文档列表 - 支持分页"""
-    # 获取用户的文档查询集
-    queryset = Document.objects.filter(owner_id=request.auth.id).order_by("-created_at")
+    # 获取用户的文档查询集，只取列表需要的列（file用于计算文件大小），不加载error_message等大字段
+    queryset = (
+        Document.objects.filter(owner_id=request.auth.id)
+        .only("id", "title", "description", "file", "file_type", "status", "created_at", "updated_at", "task_id")
+        .order_by("-created_at")
+    )
 
     # 创建分页器
     paginator = Paginator(queryset, page_size)
@@ -83,9 +92,11 @@ def get_document(request, document_id: int):
 def create_document(request, document_in: DocumentIn, file: UploadedFile = File(...)):
     """上传新文档"""
     # 确定文件类型
-    file_extension = file.name.split(".")[-1].lower()
-    file_type_mapping = {"pdf": "pdf", "docx": "docx", "txt": "txt"}
-    file_type = file_type_mapping.get(file_extension, "txt")
+    file_extension = file.name.rpartition(".")[2].lower()
+    file_type = _FILE_TYPE_MAP.get(file_extension, "txt")
+
+    # 预先生成任务ID，随文档一次性写入，省去入队后的第二次UPDATE
+    task_id = str(uuid.uuid4())
 
     # 创建文档对象
     document = Document.objects.create(
@@ -95,14 +106,11 @@ def create_document(request, document_in: DocumentIn, file: UploadedFile = File(
         file_type=file_type,
         owner_id=request.auth.id,
         status="pending",
+        task_id=task_id,
     )
 
     # 使用Celery任务处理文档，避免阻塞API响应
-    task = process_document_task.delay(document.id)
-
-    # 保存任务ID
-    document.task_id = task.id
-    document.save(update_fields=["task_id"])
+    process_document_task.apply_async(args=[document.id], task_id=task_id)
 
     return document
 
@@ -115,8 +123,8 @@ def delete_document(request, document_id: int):
     # 使用软删除，不需要删除chunks和向量
     document.soft_delete()
 
-    # 清除所有向量搜索缓存，因为删除文档会影响搜索结果
-    VectorDBService.clear_search_cache()
+    # 只清除结果中包含该文档的向量搜索缓存，其他查询的缓存不受影响
+    VectorDBService.invalidate_document_cache(document.id)
 
     return {"success": True, "message": "文档已删除"}
 
@@ -143,17 +151,15 @@ def reindex_document(request, document_id: int, reindex_data: ReindexDocumentIn
             embedding_model_version = settings.EMBEDDING_MODEL_VERSION
 
     # 在后台线程重新处理文档
-    # 更新文档状态
+    # 更新文档状态和预先生成的任务ID，一次保存
+    task_id = str(uuid.uuid4())
     document.status = "pending"
     document.error_message = ""
     document.embedding_model_version = embedding_model_version  # 记录使用的模型版本
+    document.task_id = task_id
     document.save()
 
-    task = reprocess_document_task.delay(document.id, embedding_model_version)
-
-    # 保存任务ID
-    document.task_id = task.id
-    document.save(update_fields=["task_id"])
+    reprocess_document_task.apply_async(args=[document.id, embedding_model_version], task_id=task_id)
 
     return document
 
@@ -1,9 +1,6 @@
-import os
 import time
 from django.core.management.base import BaseCommand, CommandError
-from django.conf import settings
 from loguru import logger
-import redis
 
 from documents.models import Document
 from documents.services.vector_db_service import VectorDBService
@@ -29,16 +26,20 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.WARNING("=== 开始重建向量索引 ==="))
 
-        # 步骤1: 清除pgvector中的向量（pgvector使用数据库存储，不需要删除文件）
-        self._clear_pgvector_embeddings()
-
-        # 步骤2: 清除Redis缓存
-        self._clear_redis_cache()
-
-        # 步骤3: 重新索引所有文档 (如果指定了--reindex选项)
         if reindex:
+            # 重新索引时不预先清空向量：逐个文档原地替换，
+            # 未处理到的文档继续使用旧向量提供检索，避免重建期间搜索不可用
             self._reindex_all_documents(model_version)
+
+            # 全部重建完成后再清除Redis缓存
+            self._clear_redis_cache()
         else:
+            # 步骤1: 清除pgvector中的向量（pgvector使用数据库存储，不需要删除文件）
+            self._clear_pgvector_embeddings()
+
+            # 步骤2: 清除Redis缓存
+            self._clear_redis_cache()
+
             self.stdout.write(
                 self.style.WARNING("向量已清除，但未重新索引文档。若要自动重新索引所有文档，请使用 --reindex 选项。")
             )
@@ -59,52 +60,13 @@ class Command(BaseCommand):
         except Exception as e:
             self.stdout.write(self.style.ERROR(f"清除pgvector向量失败: {str(e)}"))
 
-    def _delete_index_files(self, index_file, mapping_file):
-        """删除索引文件"""
-        self.stdout.write("正在删除索引文件...")
-
-        files_deleted = 0
-        if os.path.exists(index_file):
-            os.remove(index_file)
-            self.stdout.write(f"  ✓ 已删除索引文件: {index_file}")
-            files_deleted += 1
-        else:
-            self.stdout.write(f"  - 索引文件不存在: {index_file}")
-
-        if os.path.exists(mapping_file):
-            os.remove(mapping_file)
-            self.stdout.write(f"  ✓ 已删除映射文件: {mapping_file}")
-            files_deleted += 1
-        else:
-            self.stdout.write(f"  - 映射文件不存在: {mapping_file}")
-
-        if files_deleted > 0:
-            self.stdout.write(self.style.SUCCESS(f"成功删除了 {files_deleted} 个索引相关文件"))
-        else:
-            self.stdout.write(self.style.WARNING("未找到需要删除的索引文件"))
-
     def _clear_redis_cache(self):
-        """清除Redis中的索引相关缓存"""
+        """清除Redis中的向量搜索缓存，并通知各进程清空进程内检索缓存"""
         self.stdout.write("正在清除Redis缓存...")
 
         try:
-            r = redis.Redis(
-                host=settings.REDIS_HOST,
-                port=settings.REDIS_PORT,
-                db=settings.REDIS_DB,
-                password=settings.REDIS_PASSWORD if hasattr(settings, "REDIS_PASSWORD") else None,
-            )
-
-            # 清除向量搜索缓存
-            pattern_search = "smartdocs:cache:vector_search:*"
-            keys_search = r.keys(pattern_search)
-            if keys_search:
-                r.delete(*keys_search)
-                self.stdout.write(f"  ✓ 已删除 {len(keys_search)} 个向量搜索缓存")
-            else:
-                self.stdout.write("  - 未找到向量搜索缓存")
-
-            self.stdout.write(self.style.SUCCESS(f"成功清除了 {len(keys_search)} 个Redis缓存键"))
+            count = VectorDBService.clear_search_cache()
+            self.stdout.write(self.style.SUCCESS(f"成功清除了 {count} 个向量搜索缓存"))
 
         except Exception as e:
             self.stdout.write(self.style.ERROR(f"清除Redis缓存失败: {str(e)}"))
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.3 on 2026-10-16 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_migrate_faiss_to_pgvector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['owner_id', '-created_at'], name='doc_owner_active_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.3 on 2026-10-16 18:40
+
+import pgvector.django.halfvec
+import pgvector.django.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_document_doc_owner_active_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='documentchunk',
+            name='embedding',
+            field=pgvector.django.halfvec.HalfVectorField(blank=True, dimensions=768, null=True, verbose_name='嵌入向量'),
+        ),
+        migrations.AddIndex(
+            model_name='documentchunk',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=200, fields=['embedding'], m=32, name='chunk_embedding_halfvec_hnsw_idx', opclasses=['halfvec_cosine_ops']),
+        ),
+    ]
@@ -2,14 +2,14 @@ from django.db import models
 from django.contrib.auth.models import User
 import uuid
 import os
-from pgvector.django import VectorField
+from pgvector.django import HalfVectorField, HnswIndex
 
 
 def document_file_path(instance, filename):
     """为上传的文档生成唯一的文件路径"""
-    ext = filename.split(".")[-1]
-    filename = f"{uuid.uuid4()}.{ext}"
-    return os.path.join("documents", str(instance.owner_id), filename)
+    # splitext返回的扩展名已包含"."，uuid使用hex去掉连字符，得到更短的存储键
+    _, ext = os.path.splitext(filename)
+    return f"documents/{instance.owner_id}/{uuid.uuid4().hex}{ext.lower()}"
 
 
 class DocumentManager(models.Manager):
@@ -83,6 +83,12 @@ class Document(models.Model):
         indexes = [
             models.Index(fields=["doc_category", "status"]),  # 加速查询
             models.Index(fields=["owner_id", "doc_category"]),
+            # 文档列表：owner_id过滤 + created_at倒序分页，只索引未删除的文档
+            models.Index(
+                fields=["owner_id", "-created_at"],
+                name="doc_owner_active_idx",
+                condition=models.Q(is_deleted=False),
+            ),
         ]
 
     def __str__(self):
@@ -111,8 +117,8 @@ class DocumentChunk(models.Model):
     content = models.TextField("内容")
     chunk_index = models.IntegerField("块索引")
 
-    # pgvector 存储 768 维度的向量嵌入
-    embedding = VectorField("嵌入向量", dimensions=768, null=True, blank=True, db_index=True)
+    # pgvector 以半精度存储 768 维度的向量嵌入，表和索引占用减半，召回率几乎不受影响（近邻检索使用Meta中的HNSW索引）
+    embedding = HalfVectorField("嵌入向量", dimensions=768, null=True, blank=True)
 
     # 存储块向量化时使用的嵌入模型版本
     embedding_model_version = models.CharField("嵌入模型版本", max_length=50, null=True, blank=True)
@@ -133,6 +139,16 @@ class DocumentChunk(models.Model):
         verbose_name_plural = "文档块"
         ordering = ["document_id", "chunk_index"]
         unique_together = ("document_id", "chunk_index")
+        indexes = [
+            # HNSW近似近邻索引，检索按余弦距离排序，查询复杂度为对数级而非全表扫描
+            HnswIndex(
+                fields=["embedding"],
+                name="chunk_embedding_halfvec_hnsw_idx",
+                m=32,
+                ef_construction=200,
+                opclasses=["halfvec_cosine_ops"],
+            ),
+        ]
 
     def __str__(self):
         return f"文档ID:{self.document_id} - 块{self.chunk_index}"
@@ -0,0 +1,17 @@
+"""
+PDF按页段提取文本的子进程任务
+
+文本提取在后台预取线程中进行，进程池使用spawn方式启动子进程（在多线程进程中fork可能死锁），
+子进程按模块路径导入任务函数；本模块位于documents.services包之外且只依赖pymupdf，子进程导入时不会加载Django
+"""
+
+from typing import List
+
+import pymupdf
+
+
+def extract_pdf_page_range(args) -> List[str]:
+    """子进程中提取PDF指定页段的文本，每个进程各自打开文档"""
+    file_path, start, stop = args
+    with pymupdf.open(file_path) as pdf:
+        return [pdf[i].get_text("text") or "" for i in range(start, stop)]
@@ -3,16 +3,103 @@
 使用策略模式实现不同的分块算法
 """
 
+import functools
+import hashlib
 import re
+import threading
+from collections import OrderedDict
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from loguru import logger
 
-
-import json
-import requests
-from typing import List, Dict, Any, Optional, Tuple
-from django.conf import settings
+# 预编译的正则表达式，避免每次调用（以及循环内）重复编译
+# 文档结构识别
+_MD_HEADER_RE = re.compile(r"^(#{1,6})\s+(.+)$")
+_NUMBERED_HEADER_RE = re.compile(r"^(\d+\.\d*)\s+(.+)$")
+_CN_HEADER_RE = re.compile(r"^第([一二三四五六七八九十百千万]+)[章节篇]\s*[:：]?\s*(.+)$")
+
+# 文档标题识别
+_MD_H1_RE = re.compile(r"^#\s+")
+_CN_TITLE_RE = re.compile(r"^第([一二三四五六七八九十百千万]+)[章部]")
+
+# 自动选择策略时用于统计标题行的模式：Markdown标题、数字编号、中文章节、A./A)条目
+# 合并为一个多行模式，对文本头部整体扫描一次；[^\S\n]匹配除换行外的空白，避免跨行匹配
+_ANY_HEADER_RE = re.compile(
+    r"^[^\S\n]*(?:#{1,6}[^\S\n]+\S|\d+\.[^\S\n]+\S|第[一二三四五六七八九十百千万]+[章节篇]|[A-Z][.)][^\S\n]+\S)",
+    re.MULTILINE,
+)
+
+# 段落和句子边界
+_PARA_SPLIT_RE = re.compile(r"\n\s*\n|\r\n\s*\r\n")
+# 句子边界字符，供模型分块在UTF-32码点数组上向量化查找
+_SENT_BOUNDARY_CHARS = "。？?！!；;，,"
+
+# 简单分块的断点：(优先级, 断点长度)，优先级数值越小越优先
+# 段落 > 句号 > 问号 > 感叹号 > 分号 > 逗号 > 空格；段落断点以"\n"加前瞻匹配，保证连续空行时也能取到最后一处
+_BOUNDARY_PRIORITY = {
+    "\n": (0, 2),
+    "。": (1, 1),
+    "？": (2, 1),
+    "?": (3, 1),
+    "！": (4, 1),
+    "!": (5, 1),
+    "；": (6, 1),
+    ";": (7, 1),
+    "，": (8, 1),
+    ",": (9, 1),
+    " ": (10, 1),
+}
+_BOUNDARY_RE = re.compile(r"\n(?=\n)|[。？?！!；;，, ]")
+# 未找到上述断点时的回溯断点
+_FALLBACK_BOUNDARY_RE = re.compile(r"[.!?\n]")
+
+
+def _head_lines(text: str, n: int) -> str:
+    """返回文本的前n行"""
+    return "\n".join(text.split("\n", n)[:n])
+
+
+@functools.lru_cache(maxsize=1)
+def _model_runtime_status() -> Tuple[bool, bool]:
+    """检查PyTorch/Transformers是否可用以及GPU是否可用，结果在进程内只计算一次"""
+    try:
+        import torch
+        import transformers  # noqa: F401
+
+        return True, torch.cuda.is_available()
+    except ImportError:
+        logger.info("未找到PyTorch或Transformers库，不使用模型分块策略")
+    except Exception as e:
+        logger.warning(f"检查模型可用性时出错: {str(e)}")
+    return False, False
+
+
+def _count_header_lines(text: str, max_lines: int = 100) -> int:
+    """统计文本前max_lines行中标题行的数量"""
+    return sum(1 for _ in _ANY_HEADER_RE.finditer(_head_lines(text, max_lines)))
+
+
+def _analysis_signature(text: str) -> Tuple[int, bytes]:
+    """
+    计算自动选择策略所依据内容的签名
+
+    选择只取决于文本长度、前100行和前10000个字符，签名覆盖两者中较长的窗口
+    """
+    window_end = -1
+    for _ in range(100):
+        window_end = text.find("\n", window_end + 1)
+        if window_end == -1:
+            window_end = len(text)
+            break
+    window = text[: max(window_end, 10000)]
+    digest = hashlib.blake2b(window.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    return len(text), digest
+
+
+# 自动选择策略的结果缓存：签名 -> 策略名称，按LRU淘汰；分块可能在多个线程中进行，读写需持锁
+_STRATEGY_VERDICT_CACHE: "OrderedDict[Tuple[int, bytes], str]" = OrderedDict()
+_STRATEGY_VERDICT_CACHE_SIZE = 1024
+_STRATEGY_VERDICT_CACHE_LOCK = threading.Lock()
 
 
 class ChunkingStrategy(ABC):
@@ -67,13 +154,12 @@ class AutoChunkingStrategy(ChunkingStrategy):
 
         # 优先查找Markdown h1标题
         for line in lines[:20]:
-            if re.match(r"^#\s+", line):
+            if _MD_H1_RE.match(line):
                 return line.replace("#", "").strip()
 
         # 其次查找中文章节标题
         for line in lines[:20]:
-            match = re.match(r"^第([一二三四五六七八九十百千万]+)[章部]", line)
-            if match:
+            if _CN_TITLE_RE.match(line):
                 return line.strip()
 
         # 最后取第一个非空、非标记行
@@ -86,14 +172,7 @@ class AutoChunkingStrategy(ChunkingStrategy):
 
     def _has_document_structure(self, text: str) -> bool:
         """检查文本是否有明显结构"""
-        patterns = [
-            r"^#{1,6}\s+.+$",  # Markdown标题
-            r"^\d+\.\s+.+$",  # 数字编号
-            r"^第[一二三四五六七八九十百千万]+[章节篇]",  # 中文章节
-            r"^[A-Z][\.\)]\s+.+$",  # A. 形式
-        ]
-        header_count = sum(1 for line in text.split("\n")[:100] if any(re.match(p, line.strip()) for p in patterns))
-        return header_count >= 3
+        return _count_header_lines(text) >= 3
 
 
 class SimpleChunkingStrategy(ChunkingStrategy):
@@ -125,49 +204,39 @@ class SimpleChunkingStrategy(ChunkingStrategy):
 
             # 寻找句子边界作为断点
             if end < len(text):
-                # 优先级：段落 > 句号 > 问号 > 感叹号 > 逗号 > 空格
-                sentence_boundaries = [
-                    "\n\n",
-                    "。",
-                    "？",
-                    "?",
-                    "！",
-                    "!",
-                    "；",
-                    ";",
-                    "，",
-                    ",",
-                    " ",
-                ]
-                found = False
-
-                for boundary in sentence_boundaries:
-                    # 在合理范围内寻找最近的断点
-                    boundary_pos = text.rfind(boundary, start + chunk_size // 2, end)
-                    if boundary_pos > start:
-                        end = boundary_pos + len(boundary)
+                # 单次扫描窗口内的所有断点，取优先级最高的类型中最靠后的一个
+                best_priority = None
+                best_end = end
+                for match in _BOUNDARY_RE.finditer(text, start + chunk_size // 2, end):
+                    priority, length = _BOUNDARY_PRIORITY[match.group()]
+                    if match.start() > start and (best_priority is None or priority <= best_priority):
+                        best_priority = priority
+                        best_end = match.start() + length
+
+                found = best_priority is not None
+                if found:
+                    end = best_end
+
+                # 如果没找到理想断点，在回溯窗口内寻找最后一个英文句末符或换行
+                if not found:
+                    last_match = None
+                    for last_match in _FALLBACK_BOUNDARY_RE.finditer(text, max(start, end - lookback) + 1, end):
+                        pass
+                    if last_match:
+                        end = last_match.end()
                         found = True
-                        break
 
-                # 如果没找到理想断点，继续回溯寻找
-                if not found:
-                    for i in range(end - 1, max(start, end - lookback), -1):
-                        if i < len(text) and text[i] in [".", "!", "?", "\n"]:
-                            end = i + 1
-                            found = True
-                            break
-
-            # 添加当前块
-            current_chunk = text[start:end].strip()
-            if current_chunk:  # 跳过空块
-                chunks.append(current_chunk)
-
-            # 确保起始点前进
-            new_start = end - overlap
-            # 防止无限循环：如果新起点不前进，则强制前进
-            if new_start <= start:
-                new_start = start + 1
-            start = min(new_start, len(text))
+            # 添加当前块：先按下标跳过首尾空白，再只切片一次
+            chunk_start, chunk_end = start, end
+            while chunk_start < chunk_end and text[chunk_start].isspace():
+                chunk_start += 1
+            while chunk_end > chunk_start and text[chunk_end - 1].isspace():
+                chunk_end -= 1
+            if chunk_end > chunk_start:  # 跳过空块
+                chunks.append(text[chunk_start:chunk_end])
+
+            # 下一块起点回退overlap个字符，且至少前进一个字符
+            start = min(max(end - overlap, start + 1), len(text))
 
             # 如果已经处理到文本末尾，退出循环
             if end >= len(text):
@@ -179,6 +248,10 @@ class SimpleChunkingStrategy(ChunkingStrategy):
 class ParagraphChunkingStrategy(ChunkingStrategy):
     """段落分块策略：尽量保持段落的完整性"""
 
+    def __init__(self):
+        # 超长段落交给简单分块处理，子策略只获取一次
+        self._simple = ChunkingStrategyFactory.create_strategy("simple")
+
     def chunk_text(self, text: str, chunk_size: int, **kwargs) -> List[str]:
         """
         基于段落的分块，尽量保持段落的完整性
@@ -191,52 +264,55 @@ class ParagraphChunkingStrategy(ChunkingStrategy):
         if not text:
             return chunks
 
-        # 分割段落
+        # 分割段落，段落长度只计算一次
         paragraphs = self._split_paragraphs(text)
-        current_chunk = []
-        current_size = 0
+        para_lens = [len(p) for p in paragraphs]
 
-        for para in paragraphs:
-            para_len = len(para)
+        # 当前块用段落下标区间 [chunk_start, i) 表示，保存时对切片做一次join
+        chunk_start = 0
+        current_size = 0
 
+        for i, para_len in enumerate(para_lens):
             if para_len > chunk_size:
                 # 如果段落本身超过最大大小
-                if current_chunk:
+                if i > chunk_start:
                     # 先保存当前块
-                    chunks.append("\n\n".join(current_chunk))
-                    current_chunk = []
-                    current_size = 0
+                    chunks.append("\n\n".join(paragraphs[chunk_start:i]))
 
                 # 然后对大段落使用简单分块
-                simple_strategy = SimpleChunkingStrategy()
-                para_chunks = simple_strategy.chunk_text(para, chunk_size // 2, overlap_ratio=0.05)
+                para_chunks = self._simple.chunk_text(paragraphs[i], chunk_size // 2, overlap_ratio=0.05)
                 chunks.extend(para_chunks)
+                chunk_start = i + 1
+                current_size = 0
             elif current_size + para_len > chunk_size:
                 # 当前块已满，保存并开始新块
-                chunks.append("\n\n".join(current_chunk))
-                current_chunk = [para]
+                chunks.append("\n\n".join(paragraphs[chunk_start:i]))
+                chunk_start = i
                 current_size = para_len
             else:
                 # 添加到当前块
-                current_chunk.append(para)
                 current_size += para_len
 
         # 处理剩余内容
-        if current_chunk:
-            chunks.append("\n\n".join(current_chunk))
+        if chunk_start < len(paragraphs):
+            chunks.append("\n\n".join(paragraphs[chunk_start:]))
 
         return chunks
 
     def _split_paragraphs(self, text: str) -> List[str]:
         """将文本分割为段落"""
         # 通过多个空行或换行符分割
-        paragraphs = re.split(r"\n\s*\n|\r\n\s*\r\n", text)
+        paragraphs = _PARA_SPLIT_RE.split(text)
         return [p.strip() for p in paragraphs if p.strip()]
 
 
 class SemanticChunkingStrategy(ChunkingStrategy):
     """语义分块策略：保留文档结构"""
 
+    def __init__(self):
+        # 过大章节及无结构文本交给段落分块处理，子策略只获取一次
+        self._paragraph = ChunkingStrategyFactory.create_strategy("paragraph")
+
     def chunk_text(self, text: str, chunk_size: int, **kwargs) -> List[str]:
         """
         语义感知分块，保留文档结构
@@ -273,8 +349,7 @@ class SemanticChunkingStrategy(ChunkingStrategy):
                     # 章节内容过大，需要分块
                     # 但保留标题信息在每个块中
                     prefix = "#" * section_level + " " if section_level else ""
-                    paragraph_strategy = ParagraphChunkingStrategy()
-                    content_chunks = paragraph_strategy.chunk_text(
+                    content_chunks = self._paragraph.chunk_text(
                         section_content, chunk_size - len(prefix) - len(section_title) - 10
                     )
 
@@ -290,8 +365,7 @@ class SemanticChunkingStrategy(ChunkingStrategy):
                         chunks.append(chunk)
         else:
             # 没有检测到结构，回退到段落分块
-            paragraph_strategy = ParagraphChunkingStrategy()
-            chunks = paragraph_strategy.chunk_text(text, chunk_size)
+            chunks = self._paragraph.chunk_text(text, chunk_size)
             if doc_title:
                 chunks = [f"{doc_title}\n\n{chunk}" for chunk in chunks]
 
@@ -303,12 +377,12 @@ class SemanticChunkingStrategy(ChunkingStrategy):
 
         # 优先查找Markdown h1标题
         for line in lines[:20]:
-            if re.match(r"^#\s+", line):
+            if _MD_H1_RE.match(line):
                 return line.replace("#", "").strip()
 
         # 其次查找中文一级章节标题
         for line in lines[:20]:
-            if re.match(r"^第([一二三四五六七八九十百千万]+)[章部]", line):
+            if _CN_TITLE_RE.match(line):
                 return line.strip()
 
         # 最后取第一个非空、非标记行
@@ -323,33 +397,22 @@ class SemanticChunkingStrategy(ChunkingStrategy):
         """从文本中提取结构信息（标题、章节等）"""
         structure = {"title": None, "sections": []}
 
-        lines = text.split("\n")
+        lines = text.splitlines()
         current_section = None
 
         # 提取文档标题（第一个非空行）
-        for line in lines:
-            if line.strip():
-                structure["title"] = line.strip()
-                break
-
-        # 识别Markdown风格标题
-        header_pattern = re.compile(r"^(#{1,6})\s+(.+)$")
-        # 识别数字编号标题
-        numbered_header_pattern = re.compile(r"^(\d+\.\d*)\s+(.+)$")
-        # 识别中文章节
-        chinese_header_pattern = re.compile(r"^第([一二三四五六七八九十百千万]+)[章节篇]\s*[:：]?\s*(.+)$")
+        structure["title"] = next((line_text for line_text in map(str.strip, lines) if line_text), None)
 
         current_content = []
 
-        for line in lines:
-            line_text = line.strip()
+        for line_text in map(str.strip, lines):
             if not line_text:
                 if current_section:
                     current_content.append("")  # 保留空行
                 continue
 
             # 检测Markdown标题
-            header_match = header_pattern.match(line_text)
+            header_match = _MD_HEADER_RE.match(line_text)
             if header_match:
                 # 如果找到新标题，保存之前的章节
                 if current_section:
@@ -364,7 +427,7 @@ class SemanticChunkingStrategy(ChunkingStrategy):
                 continue
 
             # 检测数字编号标题
-            numbered_match = numbered_header_pattern.match(line_text)
+            numbered_match = _NUMBERED_HEADER_RE.match(line_text)
             if numbered_match:
                 # 如果找到新标题，保存之前的章节
                 if current_section:
@@ -381,7 +444,7 @@ class SemanticChunkingStrategy(ChunkingStrategy):
                 continue
 
             # 检测中文章节标题
-            chinese_match = chinese_header_pattern.match(line_text)
+            chinese_match = _CN_HEADER_RE.match(line_text)
             if chinese_match:
                 # 如果找到新标题，保存之前的章节
                 if current_section:
@@ -411,10 +474,14 @@ class ChunkingStrategyFactory:
     """分块策略工厂，负责创建合适的分块策略"""
 
     @staticmethod
+    @functools.lru_cache(maxsize=8)
     def create_strategy(strategy_name: str = "auto") -> ChunkingStrategy:
         """
         创建指定的分块策略
 
+        策略对象无状态（模型策略只持有懒加载的模型），按名称缓存为单例，
+        避免每次分块都重新实例化，模型策略也不会重复加载模型
+
         Args:
             strategy_name: 策略名称 ("simple", "paragraph", "semantic", "model", "auto")
                           不指定或为"auto"时自动选择最优策略
@@ -444,63 +511,60 @@ class ChunkingStrategyFactory:
         Returns:
             ChunkingStrategy: 最适合的分块策略实例
         """
+        # 相同内容（如重试、批量重建索引）直接复用之前的选择结果
+        signature = _analysis_signature(text)
+        with _STRATEGY_VERDICT_CACHE_LOCK:
+            strategy_name = _STRATEGY_VERDICT_CACHE.get(signature)
+            if strategy_name is not None:
+                _STRATEGY_VERDICT_CACHE.move_to_end(signature)
+
+        if strategy_name is not None:
+            logger.info(f"复用缓存的分块策略选择结果: {strategy_name}")
+        else:
+            # 文本分析在锁外进行，不阻塞其他线程
+            strategy_name = ChunkingStrategyFactory._select_strategy_name(text)
+            with _STRATEGY_VERDICT_CACHE_LOCK:
+                _STRATEGY_VERDICT_CACHE[signature] = strategy_name
+                if len(_STRATEGY_VERDICT_CACHE) > _STRATEGY_VERDICT_CACHE_SIZE:
+                    _STRATEGY_VERDICT_CACHE.popitem(last=False)
+
+        return ChunkingStrategyFactory.create_strategy(strategy_name)
+
+    @staticmethod
+    def _select_strategy_name(text: str) -> str:
+        """分析文本特征，返回最适合的分块策略名称"""
         # 分析文本结构
         has_structure = False
         has_paragraphs = False
 
-        # 检查是否有标题结构
-        header_patterns = [
-            r"^#{1,6}\s+.+$",  # Markdown 标题
-            r"^\d+\.\s+.+$",  # 数字编号
-            r"^第[一二三四五六七八九十百千万]+[章节篇]",  # 中文章节标题
-            r"^[A-Z][\.\)]\s+.+$",  # A. 或 A) 形式的条目
-        ]
-
-        header_count = 0
-        lines = text.split("\n")
-        for line in lines[:100]:  # 仅检查前100行
-            line = line.strip()
-            if any(re.match(pattern, line) for pattern in header_patterns):
-                header_count += 1
-
-        has_structure = header_count >= 3
+        # 检查是否有标题结构（仅检查前100行）
+        has_structure = _count_header_lines(text) >= 3
 
-        # 检查是否有段落
-        paragraphs = re.split(r"\n\s*\n|\r\n\s*\r\n", text[:10000])  # 仅检查前10000个字符
-        paragraphs = [p.strip() for p in paragraphs if p.strip()]
-        has_paragraphs = len(paragraphs) > 5
+        # 检查是否有段落：仅统计前10000个字符中的空行分隔数，5处分隔即6个段落
+        paragraph_breaks = text.count("\n\n", 0, 10000) + text.count("\r\n\r\n", 0, 10000)
+        has_paragraphs = paragraph_breaks >= 5
 
         # 根据分析结果选择策略
         # 检查是否可以使用本地模型分块
-        use_model = False
-        try:
-            # 尝试导入torch，检查是否可以使用模型
-            import torch
-            from transformers import AutoTokenizer, AutoModel
-
-            if torch.cuda.is_available() or len(text) < 100000:  # GPU可用或文本不太大时使用模型
-                use_model = True
-        except ImportError:
-            logger.info("未找到PyTorch或Transformers库，不使用模型分块策略")
-        except Exception as e:
-            logger.warning(f"检查模型可用性时出错: {str(e)}")
+        torch_available, cuda_available = _model_runtime_status()
+        use_model = torch_available and (cuda_available or len(text) < 100000)  # GPU可用或文本不太大时使用模型
 
         # 为复杂文本使用模型策略
         if use_model and ((has_structure and len(text) > 10000) or len(text) > 50000):
             logger.info("检测到复杂文本结构，尝试使用基于模型的分块策略")
-            return LocalModelChunkingStrategy()
+            return "model"
         # 为结构化文本使用语义分块
         elif has_structure and len(text) > 5000:
             logger.info("检测到文档结构，使用语义分块策略")
-            return SemanticChunkingStrategy()
+            return "semantic"
         # 为有明显段落的文本使用段落分块
         elif has_paragraphs:
             logger.info("检测到明显段落，使用段落分块策略")
-            return ParagraphChunkingStrategy()
+            return "paragraph"
         # 其他情况使用简单分块
         else:
             logger.info("未检测到明显结构，使用简单分块策略")
-            return SimpleChunkingStrategy()
+            return "simple"
 
 
 class LocalModelChunkingStrategy(ChunkingStrategy):
@@ -530,8 +594,16 @@ class LocalModelChunkingStrategy(ChunkingStrategy):
             model_name = "bert-base-chinese"
 
             logger.info(f"正在加载本地模型: {model_name}")
-            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-            self.model = AutoModel.from_pretrained(model_name).to(self.device)
+            # 超过512个token时从左侧截断：候选段落起点相同，区分它们的是结尾部分
+            self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True, truncation_side="left")
+
+            if self.device == "cuda":
+                # GPU上使用半精度推理，支持bf16的显卡优先bf16
+                dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+                self.model = AutoModel.from_pretrained(model_name, torch_dtype=dtype).to(self.device).eval()
+            else:
+                # CPU上半精度没有收益，保持fp32
+                self.model = AutoModel.from_pretrained(model_name).to(self.device).eval()
 
             self.model_loaded = True
             logger.info("本地模型加载成功")
@@ -559,7 +631,7 @@ class LocalModelChunkingStrategy(ChunkingStrategy):
         if not self._load_model():
             # 模型加载失败，回退到段落分块
             logger.info("本地模型不可用，回退到段落分块策略")
-            paragraph_strategy = ParagraphChunkingStrategy()
+            paragraph_strategy = ChunkingStrategyFactory.create_strategy("paragraph")
             return paragraph_strategy.chunk_text(text, chunk_size)
 
         # 找出所有潜在的分块点
@@ -591,40 +663,30 @@ class LocalModelChunkingStrategy(ChunkingStrategy):
         except Exception as e:
             logger.error(f"模型分块过程中出错: {str(e)}，回退到段落分块")
             # 发生错误时回退到传统分块方法
-            paragraph_strategy = ParagraphChunkingStrategy()
+            paragraph_strategy = ChunkingStrategyFactory.create_strategy("paragraph")
             return paragraph_strategy.chunk_text(text, chunk_size)
 
         return chunks
 
     def _identify_potential_breakpoints(self, text: str, chunk_size: int) -> List[int]:
         """识别文本中潜在的分块点，基于句子和段落边界"""
-        breakpoints = []
-
-        # 寻找段落边界
-        pattern = r"\n\s*\n|\r\n\s*\r\n"
-        for match in re.finditer(pattern, text):
-            breakpoints.append(match.end())
-
-        # 寻找中文句子边界
-        sentence_patterns = [r"。", r"？", r"\?", r"！", r"!", r"；", r";", r"，", r","]
-        for pattern in sentence_patterns:
-            for match in re.finditer(pattern, text):
-                breakpoints.append(match.end())
-
-        # 排序并去重
-        breakpoints = sorted(set(breakpoints))
-
-        # 筛选合理范围内的分块点
-        valid_breakpoints = []
-        for bp in breakpoints:
-            # 分块点应该至少在chunk_size/2位置之后
-            if bp < chunk_size / 2:
-                continue
+        import numpy as np
 
-            # 添加有效断点
-            valid_breakpoints.append(bp)
+        # 中英文句子边界：编码为定长UTF-32后用NumPy一次比较出所有边界位置
+        # （surrogatepass保留提取文本中孤立的代理字符，每个字符仍对应一个码位，下标不错位）
+        codepoints = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+        boundary_codepoints = np.frombuffer(_SENT_BOUNDARY_CHARS.encode("utf-32-le"), dtype=np.uint32)
+        sentence_breaks = np.flatnonzero(np.isin(codepoints, boundary_codepoints)) + 1
 
-        return valid_breakpoints
+        # 段落边界，单次正则扫描
+        para_breaks = np.fromiter((match.end() for match in _PARA_SPLIT_RE.finditer(text)), dtype=np.int64)
+
+        # 合并、排序并去重
+        breakpoints = np.union1d(sentence_breaks, para_breaks)
+
+        # 分块点应该至少在chunk_size/2位置之后，有序数组直接切片筛选
+        first_valid = np.searchsorted(breakpoints, chunk_size / 2, side="left")
+        return breakpoints[first_valid:].tolist()
 
     def _find_best_breakpoint(
         self, text: str, start_idx: int, chunk_size: int, potential_breakpoints: List[int]
@@ -656,43 +718,26 @@ class LocalModelChunkingStrategy(ChunkingStrategy):
         try:
             import torch
 
-            # 准备候选文本段落
-            segments = []
-            for bp in candidate_breakpoints:
-                segment = text[start_idx:bp]
-                # 如果段落太长，取前后部分
-                if len(segment) > 510:  # BERT模型最大输入长度为512，留一些余量
-                    first_part = segment[:250]
-                    last_part = segment[-250:]
-                    segment = first_part + "..." + last_part
-                segments.append(segment)
-
-            # 使用模型计算每个段落的编码
-            segment_embeddings = []
-            with torch.no_grad():
-                for segment in segments:
-                    inputs = self.tokenizer(segment, return_tensors="pt", truncation=True, max_length=512).to(
-                        self.device
-                    )
-                    outputs = self.model(**inputs)
-                    # 使用CLS标记的输出作为段落表示
-                    embedding = outputs.last_hidden_state[:, 0, :].cpu().numpy()
-                    segment_embeddings.append(embedding)
-
-            # 评估每个段落的语义完整性
-            # 这里使用一个启发式方法：检查段落末尾的向量表示是否有明显的"未完成感"
-            # 我们计算每个段落最后几个token的向量表示与整个段落的表示之间的相似度
-            scores = []
-            for i, segment in enumerate(segments):
+            # 准备候选文本段落，超长部分由分词器按token截断（保留结尾，见_load_model）
+            segments = [text[start_idx:bp] for bp in candidate_breakpoints]
+
+            # 所有候选段落一次性分词并补齐为同一批次，只做一次前向计算
+            with torch.inference_mode():
+                inputs = self.tokenizer(
+                    segments, return_tensors="pt", padding=True, truncation=True, max_length=512
+                ).to(self.device)
+                outputs = self.model(**inputs)
+                # 使用CLS标记的输出作为段落表示
+                cls_embeddings = outputs.last_hidden_state[:, 0, :]
+
+                # 评估每个段落的语义完整性
                 # 为简单起见，我们使用CLS向量的范数作为一个简单指标
-                # 向量范数越大，通常表示语义信息越丰富
-                score = float(torch.norm(torch.tensor(segment_embeddings[i])))
-                scores.append(score)
+                # 向量范数越大，通常表示语义信息越丰富；在设备上一次算出全部范数，只取回argmax
+                scores = torch.linalg.vector_norm(cls_embeddings, dim=1)
+                best_idx = int(scores.argmax().item())
 
             # 选择得分最高的段落作为最佳断点
-            if scores:
-                best_idx = scores.index(max(scores))
-                return candidate_breakpoints[best_idx]
+            return candidate_breakpoints[best_idx]
 
         except Exception as e:
             logger.error(f"模型评估断点失败: {str(e)}")
@@ -1,18 +1,131 @@
+import codecs
+import io
+import itertools
+import multiprocessing
 import os
-import gc
-import PyPDF2
-import docx
-from typing import List
+import queue
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Generator, Iterable, Iterator, List, Tuple
+
 from loguru import logger
+from lxml import etree
+
+try:
+    import pymupdf
+
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    import PyPDF2
+
+    PYMUPDF_AVAILABLE = False
+    logger.warning("PyMuPDF未安装，PDF文本提取回退到PyPDF2")
 
 from django.conf import settings
+from django.db import connection, transaction
+
 from ..models import Document, DocumentChunk
-from .vector_db_service import VectorDBService
 from .hierarchical_chunking import TitleExtractor
 from .index_builder import IndexBuilder
+from .vector_db_service import VectorDBService
 
 # loguru不需要getLogger
 
+# WordprocessingML命名空间下的标签
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_P = _W_NS + "p"
+_W_T = _W_NS + "t"
+_W_TAB = _W_NS + "tab"
+_W_BR = _W_NS + "br"
+_W_CR = _W_NS + "cr"
+
+# 备用分块在段落边界之后依次尝试的句子边界（按优先级）
+_FALLBACK_SENTENCE_BOUNDARIES = ("。", "？", "！", "\n")
+
+# 文本文件样本中至少有这么多处非法utf-8序列时，才尝试按gb18030解码
+_MIN_UTF8_ERRORS_FOR_GB18030 = 8
+
+# PostgreSQL COPY写入分块时的字段（其余字段使用数据库默认值NULL）
+_COPY_CHUNK_FIELDS = (
+    "document_id",
+    "content",
+    "chunk_index",
+    "embedding_model_version",
+    "title",
+    "section_path",
+    "hierarchy_level",
+    "parent_chunk_index",
+)
+
+# COPY文本格式中需要转义的字符
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_value(value) -> str:
+    """将字段值转换为COPY文本格式，None对应\\N"""
+    if value is None:
+        return "\\N"
+    return str(value).translate(_COPY_ESCAPES)
+
+
+_PREFETCH_DONE = object()
+
+
+class _PrefetchedPieces:
+    """在后台线程中消费文本片段迭代器，通过有界队列逐段交给当前线程，使文件解析与分块入库并行"""
+
+    def __init__(self, pieces: Generator[str, None, None], max_pending: int = 16):
+        self._pieces = pieces
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stop = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="doc-extract", daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        """放入队列；消费方已关闭时返回False"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            for piece in self._pieces:
+                if not self._put(piece):
+                    return
+        except BaseException as e:
+            self._error = e
+        finally:
+            try:
+                self._pieces.close()
+            finally:
+                self._put(_PREFETCH_DONE)
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            item = self._queue.get()
+            if item is _PREFETCH_DONE:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield item
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
 
 class DocumentProcessor:
     """文档处理器，负责解析不同类型的文档并分块"""
@@ -52,22 +165,13 @@ class DocumentProcessor:
                 logger.error(f"文档{document_id}文件不存在")
                 return False
 
-            # 1. 流式提取文本
-            content = self._extract_text_stream(document)
-
-            # 2. 限制内容大小
-            if len(content) > self.max_content_size:
-                logger.warning(f"文档内容过大({len(content) / 1024 / 1024:.2f}MB)，将被截断")
-                content = content[: self.max_content_size]
-
-            # 3. 分批生成和保存分块
-            self._process_chunks(document, content)
+            # 1. 流式提取文本：后台线程逐段解析文件（超过内容上限即停止），
+            #    当前线程边接收文本边分块入库（数据库操作都在当前线程）
+            # 2. 分批生成和保存分块，替换旧分块和倒排索引
+            with _PrefetchedPieces(self._extract_text_stream(document)) as pieces:
+                self._process_chunks(document, pieces)
 
-            # 释放大文本内存
-            del content
-            gc.collect()
-
-            # 4. 创建向量索引
+            # 3. 创建向量索引
             logger.info(f"开始为文档{document_id}创建向量索引")
             indexing_result = self.vector_db.index_document(document)
 
@@ -75,9 +179,8 @@ class DocumentProcessor:
                 document.status = "processed"
                 document.save()
 
-                # 清除所有向量搜索缓存，因为新文档可能影响搜索结果
-                VectorDBService.clear_search_cache()
-                logger.info(f"文档{document_id}处理完成，已清除搜索缓存")
+                # index_document完成时已清除向量搜索缓存
+                logger.info(f"文档{document_id}处理完成")
                 return True
             else:
                 document.status = "failed"
@@ -107,8 +210,8 @@ class DocumentProcessor:
                 pass
             return False
 
-    def _extract_text_stream(self, document: Document) -> str:
-        """流式提取文本，避免一次性加载大文件"""
+    def _extract_text_stream(self, document: Document) -> Iterator[str]:
+        """流式提取文本，逐段生成文本片段，避免一次性加载大文件"""
         file_path = document.file.path
         file_size = os.path.getsize(file_path) / (1024 * 1024)  # MB
 
@@ -117,124 +220,279 @@ class DocumentProcessor:
         logger.info(f"处理文件{original_filename}，路径: {file_path}，大小: {file_size:.2f}MB")
 
         # 提取文本内容
-        content = ""
-        if document.file_type == "pdf":
-            content = self._extract_text_from_pdf_stream(file_path)
-        elif document.file_type == "docx":
-            content = self._extract_text_from_docx_stream(file_path)
-        elif document.file_type == "txt":
-            content = self._extract_text_from_txt_stream(file_path)
-        else:
+        try:
+            extractor = self._EXTRACTORS[document.file_type]
+        except KeyError:
             raise ValueError(f"不支持的文件类型: {document.file_type}")
 
         # 在内容前添加文件名信息，以便在索引和搜索中包含文件名
         file_info = f"文件名: {original_filename}\n标题: {document.title}\n\n"
-        return file_info + content
+        return self._limit_content(file_info, extractor(self, file_path))
+
+    def _limit_content(self, file_info: str, pieces: Iterator[str]) -> Iterator[str]:
+        """依次生成文件信息和正文片段，累计超过max_content_size时截断并停止读取文件"""
+        remaining = self.max_content_size
+        try:
+            for piece in itertools.chain((file_info,), pieces):
+                if len(piece) > remaining:
+                    logger.warning(f"文档内容超过{self.max_content_size / 1024 / 1024:.2f}M字符，将被截断")
+                    if remaining:
+                        yield piece[:remaining]
+                    return
+                remaining -= len(piece)
+                yield piece
+        finally:
+            pieces.close()
+
+    def _extract_text_from_pdf_stream(self, file_path: str) -> Iterator[str]:
+        """流式处理PDF文件，逐页生成文本（基于MuPDF），大文件按页段并行提取"""
+        if not PYMUPDF_AVAILABLE:
+            yield from self._extract_text_from_pdf_pypdf2(file_path)
+            return
+
+        with pymupdf.open(file_path) as pdf:
+            total_pages = pdf.page_count
+            logger.info(f"PDF有{total_pages}页")
+
+            for i, page_text in enumerate(self._iter_pdf_page_texts(pdf, file_path, total_pages)):
+                if i:
+                    yield "\n"
+                yield page_text
 
-    def _extract_text_from_pdf_stream(self, file_path: str) -> str:
-        """流式处理PDF文件，逐页提取文本"""
-        text_chunks = []
+    def _iter_pdf_page_texts(self, pdf, file_path: str, total_pages: int) -> Iterator[str]:
+        """按页码顺序生成每页文本；页数较多时先尝试并行提取，失败则从中断处串行继续"""
+        done = 0
+        if total_pages >= getattr(settings, "PDF_PARALLEL_MIN_PAGES", 50) and self._can_start_process_pool():
+            try:
+                for page_text in self._extract_pdf_pages_parallel(file_path, total_pages):
+                    yield page_text
+                    done += 1
+                return
+            except Exception as e:
+                logger.warning(f"并行提取PDF失败，从第{done + 1}页起改为串行提取: {str(e)}")
+
+        for i in range(done, total_pages):
+            if i % 5 == 0:  # 每处理5页记录一次日志
+                logger.info(f"处理PDF页面 {i + 1}/{total_pages}")
+            # "text"模式只提取文本片段，不解析图形路径
+            yield pdf[i].get_text("text") or ""
+
+    def _extract_text_from_pdf_pypdf2(self, file_path: str) -> Iterator[str]:
+        """PyMuPDF不可用时使用PyPDF2逐页生成文本"""
         with open(file_path, "rb") as file:
             pdf_reader = PyPDF2.PdfReader(file)
             total_pages = len(pdf_reader.pages)
             logger.info(f"PDF有{total_pages}页")
 
-            for i in range(total_pages):
+            for i, page in enumerate(pdf_reader.pages):
                 if i % 5 == 0:  # 每处理5页记录一次日志
                     logger.info(f"处理PDF页面 {i + 1}/{total_pages}")
-                page = pdf_reader.pages[i]
-                text_chunks.append(page.extract_text() or "")
-
-                # 每处理10页清理一次内存
-                if i % 10 == 9:
-                    gc.collect()
-
-        return "\n".join(text_chunks)
-
-    def _extract_text_from_docx_stream(self, file_path: str) -> str:
-        """处理DOCX文件，逐段提取文本"""
-        doc = docx.Document(file_path)
-        text_chunks = []
-
-        for i, para in enumerate(doc.paragraphs):
-            if para.text:
-                text_chunks.append(para.text)
-
-            # 每处理100段清理一次内存
-            if i % 100 == 99:
-                gc.collect()
-
-        return "\n".join(text_chunks)
-
-    def _extract_text_from_txt_stream(self, file_path: str) -> str:
-        """流式读取文本文件，按块处理"""
+                if i:
+                    yield "\n"
+                yield page.extract_text() or ""
+
+    @staticmethod
+    def _can_start_process_pool() -> bool:
+        """是否可以启动进程池：守护进程（如Celery prefork的工作进程）不允许创建子进程，solo池和Web进程不受影响"""
+        return not multiprocessing.current_process().daemon
+
+    @staticmethod
+    def _extract_pdf_pages_parallel(file_path: str, total_pages: int) -> Iterator[str]:
+        """使用进程池按页段提取PDF文本，按页码顺序逐页生成"""
+        from ..pdf_worker import extract_pdf_page_range
+
+        workers = getattr(settings, "PDF_EXTRACT_WORKERS", 0) or os.cpu_count() or 1
+        # 每个页段至少若干页，避免每页都重新打开文档
+        span = max(8, -(-total_pages // (workers * 4)))
+        ranges = [(file_path, start, min(start + span, total_pages)) for start in range(0, total_pages, span)]
+        logger.info(f"并行提取PDF文本: {len(ranges)}个页段，{workers}个进程")
+
+        # 调用方是后台预取线程，使用spawn启动子进程，避免在多线程进程中fork
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            for page_texts in executor.map(extract_pdf_page_range, ranges):
+                yield from page_texts
+        finally:
+            # 提前停止消费（如内容超限）时取消尚未开始的页段，不等待正在提取的页段
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _extract_text_from_docx_stream(self, file_path: str) -> Iterator[str]:
+        """流式处理DOCX文件：用iterparse逐段解析word/document.xml，逐段生成文本，解析完的段落立即释放"""
+        emitted = False
+
+        with zipfile.ZipFile(file_path) as docx_zip, docx_zip.open("word/document.xml") as xml_file:
+            for _, para in etree.iterparse(xml_file, events=("end",), tag=_W_P):
+                parts = []
+                for node in para.iter(_W_T, _W_TAB, _W_BR, _W_CR):
+                    if node.tag == _W_T:
+                        parts.append(node.text or "")
+                    elif node.tag == _W_TAB:
+                        parts.append("\t")
+                    else:
+                        parts.append("\n")
+                para_text = "".join(parts)
+
+                # 释放已处理段落及其之前的兄弟节点
+                para.clear()
+                while para.getprevious() is not None:
+                    del para.getparent()[0]
+
+                if para_text:
+                    if emitted:
+                        yield "\n"
+                    yield para_text
+                    emitted = True
+
+    def _extract_text_from_txt_stream(self, file_path: str) -> Iterator[str]:
+        """流式读取文本文件，按1MB块生成文本，解码到内容上限即停止"""
         chunk_size = 1024 * 1024  # 1MB
-        text_chunks = []
-
-        with open(file_path, "r", encoding="utf-8", errors="replace") as file:
-            while True:
-                chunk = file.read(chunk_size)
-                if not chunk:
-                    break
-                text_chunks.append(chunk)
+        # 多读一个字符，由_limit_content判断是否超限并记录截断
+        remaining = self.max_content_size + 1
+
+        with open(file_path, "rb") as raw_file:
+            encoding = self._detect_text_encoding(raw_file)
+            with io.TextIOWrapper(raw_file, encoding=encoding, errors="replace") as file:
+                while remaining > 0:
+                    chunk = file.read(min(chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+
+    # 文件类型到提取方法的分发表
+    _EXTRACTORS = {
+        "pdf": _extract_text_from_pdf_stream,
+        "docx": _extract_text_from_docx_stream,
+        "txt": _extract_text_from_txt_stream,
+    }
+
+    @staticmethod
+    def _detect_text_encoding(raw_file, sample_size: int = 64 * 1024) -> str:
+        """根据文件头部样本推断文本编码，只读取前64KB，读取后复位文件指针"""
+        sample = raw_file.read(sample_size)
+        raw_file.seek(0)
+
+        if sample.startswith(codecs.BOM_UTF8):
+            return "utf-8-sig"
+        if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            return "utf-16"
+
+        # 默认按utf-8读取（非法字节替换）；只有样本中多处不是合法utf-8、且能按gb18030完整解码时才切换编码，
+        # 避免utf-8文件中个别损坏字节导致整个文件被按gb18030解码成乱码。
+        # 使用增量解码器，避免样本末尾被截断的多字节字符误判为编码错误；样本中原有的U+FFFD不计入错误
+        decoded = codecs.getincrementaldecoder("utf-8")(errors="replace").decode(sample, final=False)
+        utf8_errors = decoded.count("\ufffd") - sample.count("\ufffd".encode("utf-8"))
+        if utf8_errors < _MIN_UTF8_ERRORS_FOR_GB18030:
+            return "utf-8"
 
-                # 每读取5MB清理一次内存
-                if len(text_chunks) % 5 == 0:
-                    gc.collect()
-
-        return "".join(text_chunks)
-
-    def _process_chunks(self, document: Document, content: str):
-        """分批处理文本分块、保存和建立倒排索引"""
-        # 1. 先删除现有分块和对应的倒排索引
-        chunk_ids = DocumentChunk.objects.filter(document_id=document.id).values_list("id", flat=True)
-        if chunk_ids:
-            IndexBuilder.delete_index_for_document(document.id)
-
-        DocumentChunk.objects.filter(document_id=document.id).delete()
+        try:
+            codecs.getincrementaldecoder("gb18030")().decode(sample, final=False)
+            return "gb18030"
+        except UnicodeDecodeError:
+            logger.warning("无法识别文本编码，按utf-8替换非法字符读取")
+            return "utf-8"
+
+    def _delete_existing_chunks(self, document: Document):
+        """删除文档现有的分块和对应的倒排索引"""
+        # 倒排索引按chunk_id子查询删除，无需先取出全部chunk_id判断是否存在
+        IndexBuilder.delete_index_for_document(document.id)
+
+        # DocumentChunk没有外键引用，也没有注册删除信号，直接执行DELETE，跳过Collector收集
+        chunks = DocumentChunk.objects.filter(document_id=document.id)
+        chunks._raw_delete(chunks.db)
+
+    def _process_chunks(self, document: Document, pieces: Iterable[str]):
+        """
+        分批处理文本分块、保存和建立倒排索引，替换文档的旧分块
 
-        # 2. 一次性完成：分块 + 提取元数据
+        文本提取和分块在事务之外进行；每批分块的写入单独使用一个短事务，
+        第一批与删除旧分块在同一事务中，因此在得到第一批分块之前提取失败时，旧分块保持不变
+        """
+        # 1. 一次性完成：流式分块 + 提取元数据（生成器，按批消费，不物化全文和全部分块）
         logger.info(f"开始对文档{document.id}进行分块和元数据提取")
-        chunks_with_metadata = self._chunk_and_extract_metadata(content)
-        logger.info(f"文档{document.id}分块完成，共{len(chunks_with_metadata)}个块")
-
-        # 3. 批量保存分块并建立倒排索引
-        batch_size = 20
-        total_chunks = len(chunks_with_metadata)
-
-        for i in range(0, total_chunks, batch_size):
-            batch = chunks_with_metadata[i : i + batch_size]
-            chunk_objects = []
-
-            for idx, chunk_data in enumerate(batch):
-                chunk_index = i + idx
-
-                chunk_objects.append(
-                    DocumentChunk(
-                        document_id=document.id,
-                        content=chunk_data["content"],
-                        chunk_index=chunk_index,
-                        embedding_model_version=self.embedding_model_version,
-                        title=chunk_data.get("title"),
-                        section_path=chunk_data.get("section_path"),
-                        hierarchy_level=chunk_data.get("hierarchy_level", 0),
-                        parent_chunk_index=chunk_index - 1 if chunk_index > 0 else None,
-                    )
+        chunk_iter = self._chunk_and_extract_metadata(pieces)
+
+        # 2. 批量保存分块并建立倒排索引（按批物化以限制内存，bulk_create按同样大小拆分INSERT语句）
+        batch_size = getattr(settings, "DOCUMENT_CHUNK_BULK_BATCH_SIZE", 1000)
+        chunk_index = 0
+        doc_id = document.id
+        model_version = self.embedding_model_version
+        deleted = False
+
+        while batch := list(itertools.islice(chunk_iter, batch_size)):
+            chunk_objects = [
+                DocumentChunk(
+                    document_id=doc_id,
+                    content=chunk_data["content"],
+                    chunk_index=i,
+                    embedding_model_version=model_version,
+                    title=chunk_data.get("title"),
+                    section_path=chunk_data.get("section_path"),
+                    hierarchy_level=chunk_data.get("hierarchy_level", 0),
+                    parent_chunk_index=i - 1 if i > 0 else None,
                 )
+                for i, chunk_data in enumerate(batch, chunk_index)
+            ]
+            chunk_index += len(chunk_objects)
+
+            with transaction.atomic():
+                if not deleted:
+                    self._delete_existing_chunks(document)
+                    deleted = True
+
+                # 批量创建：PostgreSQL（psycopg2驱动）走COPY协议，绕过INSERT语句解析
+                if self._supports_copy_expert():
+                    created_chunks = self._bulk_copy_chunks(document, chunk_objects)
+                else:
+                    created_chunks = DocumentChunk.objects.bulk_create(chunk_objects, batch_size=batch_size)
 
-            # 批量创建
-            created_chunks = DocumentChunk.objects.bulk_create(chunk_objects)
+                # 3. 为每个chunk建立倒排索引
+                for chunk in created_chunks:
+                    IndexBuilder.build_index_for_chunk(chunk)
 
-            # 4. 为每个chunk建立倒排索引
-            for chunk in created_chunks:
-                IndexBuilder.build_index_for_chunk(chunk)
+            logger.info(f"保存了{len(chunk_objects)}个文档块并建立倒排索引，已保存: {chunk_index}")
 
-            logger.info(f"保存了{len(chunk_objects)}个文档块并建立倒排索引，进度: {min(i + batch_size, total_chunks)}/{total_chunks}")
+        # 没有生成任何分块时也要清除旧分块
+        if not deleted:
+            self._delete_existing_chunks(document)
 
-            # 释放内存
-            del chunk_objects
-            del created_chunks
-            gc.collect()
+        logger.info(f"文档{document.id}分块完成，共{chunk_index}个块")
+
+    @staticmethod
+    def _supports_copy_expert() -> bool:
+        """当前连接是否为psycopg2驱动的PostgreSQL：COPY写入依赖psycopg2的copy_expert，psycopg 3没有该方法"""
+        if connection.vendor != "postgresql":
+            return False
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+        return not is_psycopg3
+
+    def _bulk_copy_chunks(self, document: Document, chunk_objects: List[DocumentChunk]) -> List[DocumentChunk]:
+        """使用COPY FROM STDIN写入一批分块，并回填主键供建立倒排索引使用"""
+        buf = io.StringIO()
+        for obj in chunk_objects:
+            buf.write("\t".join(_copy_value(getattr(obj, name)) for name in _COPY_CHUNK_FIELDS))
+            buf.write("\n")
+        buf.seek(0)
+
+        quote_name = connection.ops.quote_name
+        table = quote_name(DocumentChunk._meta.db_table)
+        columns = ", ".join(quote_name(DocumentChunk._meta.get_field(name).column) for name in _COPY_CHUNK_FIELDS)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buf)
+
+        # COPY不返回主键，按(document_id, chunk_index)唯一约束取回
+        ids = dict(
+            DocumentChunk.objects.filter(
+                document_id=document.id,
+                chunk_index__gte=chunk_objects[0].chunk_index,
+                chunk_index__lte=chunk_objects[-1].chunk_index,
+            ).values_list("chunk_index", "id")
+        )
+        for obj in chunk_objects:
+            obj.id = ids[obj.chunk_index]
+            obj._state.adding = False
+        return chunk_objects
 
     # 使用LangChain RecursiveCharacterTextSplitter的分块算法
     def _chunk_text(self, text: str, chunk_size: int = 1000, chunk_overlap: int = 100) -> List[str]:
@@ -312,9 +570,8 @@ class DocumentProcessor:
                     end = para_pos + 2
                 else:
                     # 其次在句号断开
-                    sentence_boundaries = ["。", "？", "！", "\n"]
                     found = False
-                    for boundary in sentence_boundaries:
+                    for boundary in _FALLBACK_SENTENCE_BOUNDARIES:
                         boundary_pos = text.rfind(boundary, start + chunk_size // 2, end)
                         if boundary_pos > start:
                             end = boundary_pos + len(boundary)
@@ -329,63 +586,136 @@ class DocumentProcessor:
 
         return chunks
 
-    def _chunk_and_extract_metadata(self, text: str) -> list[dict[str, any]]:
+    def _chunk_text_stream(
+        self, pieces: Iterable[str], chunk_size: int = 1000, chunk_overlap: int = 100, window_size: int = 64 * 1000
+    ) -> Iterator[Tuple[int, str]]:
         """
-        一次遍历：分块 + 提取标题元数据
-
-        关键思想：维护标题栈，为每个chunk记录当前的标题路径
+        滚动窗口流式分块：累积文本片段到window_size后分块，输出除最后一块外的所有块，
+        最后一块可能被窗口截断，从它的起点开始与后续文本一起重新分块
 
         Args:
-            text: 完整文本
+            pieces: 文本片段迭代器，依次拼接即为完整文本
+            chunk_size: 目标块大小
+            chunk_overlap: 块间重叠字符数
+            window_size: 每次分块的窗口大小
 
-        Returns:
-            [{content, title, section_path, hierarchy_level}, ...]
+        Yields:
+            (chunk在全文中的位置, chunk文本)
         """
-        # 1. 先完成分块
-        chunks = self._chunk_text(text)
-        if not chunks:
-            return []
-
-        # 2. 一次性扫描文本，记录所有标题及其位置
-        lines = text.split("\n")
-        title_positions = []  # [(pos, title, level), ...]
-        current_pos = 0
-
-        for line in lines:
-            title_info = TitleExtractor.extract_title(line)
+        pending = []
+        pending_len = 0
+        base = 0  # pending首字符在全文中的位置
+
+        for piece in pieces:
+            pending.append(piece)
+            pending_len += len(piece)
+            if pending_len < window_size:
+                continue
+
+            text = "".join(pending)
+            chunks = self._chunk_text(text, chunk_size, chunk_overlap)
+            if len(chunks) < 2:
+                pending = [text]
+                continue
+
+            cursor = 0
+            for chunk in chunks[:-1]:
+                pos = text.find(chunk, cursor)
+                pos = cursor if pos == -1 else pos
+                yield base + pos, chunk
+                cursor = pos + 1
+
+            tail_start = text.find(chunks[-1], cursor)
+            tail_start = cursor if tail_start == -1 else tail_start
+            pending = [text[tail_start:]]
+            pending_len = len(pending[0])
+            base += tail_start
+
+        text = "".join(pending)
+        cursor = 0
+        for chunk in self._chunk_text(text, chunk_size, chunk_overlap) if text else []:
+            pos = text.find(chunk, cursor)
+            pos = cursor if pos == -1 else pos
+            yield base + pos, chunk
+            cursor = pos + 1
+
+    @staticmethod
+    def _scan_titles(pieces: Iterable[str], title_positions: deque) -> Iterator[str]:
+        """
+        逐行识别标题并记录(位置, 标题, 级别)，同时把文本按完整行转发给分块
+
+        只转发到最后一个换行为止的文本，未结束的行留到下一片段，
+        保证下游分块时其之前的标题均已记录
+        """
+        line_start = 0
+        partial = ""
+
+        for piece in pieces:
+            buffer = partial + piece
+            cut = buffer.rfind("\n") + 1
+            if not cut:
+                partial = buffer
+                continue
+
+            complete, partial = buffer[:cut], buffer[cut:]
+            for line in complete[:-1].split("\n"):
+                title_info = TitleExtractor.extract_title(line)
+                if title_info:
+                    title, level = title_info
+                    title_positions.append((line_start, title, level))
+                line_start += len(line) + 1  # +1 for newline
+            yield complete
+
+        if partial:
+            title_info = TitleExtractor.extract_title(partial)
             if title_info:
                 title, level = title_info
-                title_positions.append((current_pos, title, level))
-            current_pos += len(line) + 1  # +1 for newline
-
-        # 3. 为每个chunk找到对应的标题路径
-        results = []
-        for chunk_text in chunks:
-            # 在文本中找到chunk的位置
-            chunk_pos = text.find(chunk_text)
-            if chunk_pos == -1:
-                chunk_pos = 0
-
-            # 收集这个chunk之前的所有标题，建立栈
-            title_stack = []  # [(title, level), ...]
-            for pos, title, level in title_positions:
-                if pos >= chunk_pos:
-                    break
+                title_positions.append((line_start, title, level))
+            yield partial
+
+    def _chunk_and_extract_metadata(self, pieces: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """
+        一次遍历：流式分块 + 提取标题元数据
+
+        关键思想：文本片段先经过标题识别再进入滚动窗口分块，
+        按chunk位置递增地维护标题栈，为每个chunk记录当前的标题路径
+
+        Args:
+            pieces: 文本片段迭代器，依次拼接即为完整文本
+
+        Yields:
+            {content, title, section_path, hierarchy_level}，按分块顺序逐个生成；
+            跳过空白块以及与最近块重复的块，减少无效的嵌入调用
+        """
+        title_positions = deque()  # [(pos, title, level), ...]，按位置递增
+        title_stack = []  # [(title, level), ...]，level严格递增
+        recent_hashes = deque(maxlen=16)  # 最近输出块的哈希，用于去除重叠边界处的重复块
+
+        for chunk_pos, chunk_text in self._chunk_text_stream(self._scan_titles(pieces, title_positions)):
+            # 把这个chunk之前的标题依次入栈
+            while title_positions and title_positions[0][0] < chunk_pos:
+                _, title, level = title_positions.popleft()
                 # 栈管理：移除所有 level >= 当前level 的元素
-                title_stack = [(t, lvl) for t, lvl in title_stack if lvl < level]
+                while title_stack and title_stack[-1][1] >= level:
+                    title_stack.pop()
                 title_stack.append((title, level))
 
+            stripped = chunk_text.strip()
+            if not stripped:
+                continue
+            chunk_hash = hash(stripped)
+            if chunk_hash in recent_hashes:
+                continue
+            recent_hashes.append(chunk_hash)
+
             # 提取元数据
             current_title = title_stack[-1][0] if title_stack else ""
             section_path = " > ".join([t for t, _ in title_stack])
             hierarchy_level = title_stack[-1][1] if title_stack else 0
 
-            results.append({
+            yield {
                 "content": chunk_text,
                 "title": current_title,
                 "section_path": section_path,
                 "hierarchy_level": hierarchy_level,
-            })
-
-        return results
-
+            }
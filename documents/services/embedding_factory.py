@@ -1,3 +1,4 @@
+import functools
 from typing import Optional
 from loguru import logger
 from django.conf import settings
@@ -17,17 +18,27 @@ def get_embedding_service(embedding_model_version: Optional[str] = None):
         ValueError: 当配置的嵌入服务类型无效时抛出
     """
     # 获取嵌入服务类型配置
-    service_type = getattr(settings, "EMBEDDING_SERVICE_TYPE", "api")
+    service_type = getattr(settings, "EMBEDDING_SERVICE_TYPE", "api").lower()
+    return _create_embedding_service(service_type, embedding_model_version)
+
+
+@functools.lru_cache(maxsize=4)
+def _create_embedding_service(service_type: str, embedding_model_version: Optional[str]):
+    """
+    按(服务类型, 模型版本)创建并复用嵌入服务实例，避免每次处理文档都重建客户端或重新加载模型
+
+    实例在进程内共享：服务只持有配置和客户端，clear_cache()只清理Redis中的向量缓存，不影响共享的客户端
+    """
     logger.info(f"使用嵌入服务类型: {service_type}")
 
-    if service_type.lower() == "api":
+    if service_type == "api":
         # 使用API嵌入服务
         from documents.services.embedding_service import EmbeddingService
 
         logger.info(f"创建API嵌入服务，模型版本: {embedding_model_version or settings.EMBEDDING_MODEL_VERSION}")
         return EmbeddingService(embedding_model_version=embedding_model_version)
 
-    elif service_type.lower() == "local":
+    elif service_type == "local":
         # 使用本地嵌入服务
         try:
             from documents.services.local_embedding_service import LocalEmbeddingService
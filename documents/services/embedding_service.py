@@ -2,8 +2,15 @@ import numpy as np
 from loguru import logger
 import os
 import hashlib
+import base64
+import re
+import unicodedata
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 from django.conf import settings
 from django.core.cache import cache
+import httpx
 from openai import OpenAI
 import requests.exceptions
 from common.utils.retry_utils import retry, log_retry, RetryableError
@@ -16,8 +23,40 @@ class EmbeddingAPIError(RetryableError):
     pass
 
 
+class EmbeddingFailedError(Exception):
+    """嵌入获取失败且不可重试（如未配置API密钥、请求被拒绝），调用方应跳过对应文本而不是写入替代向量"""
+
+    pass
+
+
+# HTTP/2需要可选依赖h2（httpx[http2]），未安装时使用HTTP/1.1长连接
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 # loguru不需要getLogger
 
+# 缓存键归一化时合并的空白字符
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _normalize_for_cache(text: str) -> str:
+    """缓存键归一化：NFC规范化、合并连续空白并去除首尾空白，使仅空白/编码形式不同的文本命中同一缓存"""
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+@functools.lru_cache(maxsize=1)
+def _http_client() -> httpx.Client:
+    """进程内共享的HTTP客户端，复用TCP/TLS连接（可用时启用HTTP/2多路复用），httpx.Client本身线程安全"""
+    return httpx.Client(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        timeout=httpx.Timeout(30.0, connect=5.0),
+    )
+
 
 class EmbeddingService:
     """向量嵌入服务，负责文本向量化"""
@@ -41,6 +80,9 @@ class EmbeddingService:
         self.embedding_model_version = embedding_model_version or settings.EMBEDDING_MODEL_VERSION
         self.vector_dim = settings.EMBEDDING_MODEL_DIMENSIONS
 
+        # 向量返回格式："float"或"base64"（响应更小、免去浮点数解析，需服务端支持）
+        self.encoding_format = getattr(settings, "EMBEDDING_ENCODING_FORMAT", "float")
+
         # 缓存配置
         self.cache_timeout = getattr(settings, "EMBEDDING_CACHE_TIMEOUT", 86400)  # 24小时
         self.enable_cache = getattr(settings, "EMBEDDING_CACHE_ENABLED", True)
@@ -50,13 +92,31 @@ class EmbeddingService:
         )
 
         # 创建OpenAI客户端（使用DashScope兼容模式）
-        self.client = OpenAI(api_key=self.api_key, base_url="https://dashscope.aliyuncs.com/compatible-mode/v1")
+        self.client = OpenAI(
+            api_key=self.api_key,
+            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+            http_client=_http_client(),
+        )
 
     def _get_cache_key(self, text: str) -> str:
         """生成缓存键"""
-        # 使用文本内容和模型版本生成缓存键
-        content = f"{text}:{self.embedding_model_version}"
-        return f"embedding:{hashlib.md5(content.encode('utf-8')).hexdigest()[:16]}"
+        # 使用归一化后的文本内容和模型版本生成缓存键（调用API时仍使用原文）；
+        # blake2b直接输出所需长度的摘要，且比md5更快
+        digest = hashlib.blake2b(_normalize_for_cache(text).encode("utf-8"), digest_size=16)
+        digest.update(f":{self.embedding_model_version}".encode("utf-8"))
+        return f"embedding:{digest.hexdigest()}"
+
+    @staticmethod
+    def _embedding_from_cache(cached_data) -> np.ndarray:
+        """将缓存值还原为float32数组：新格式为原始float32字节，兼容旧的浮点列表格式"""
+        if isinstance(cached_data, bytes):
+            return np.frombuffer(cached_data, dtype=np.float32)
+        return np.array(cached_data, dtype=np.float32)
+
+    @staticmethod
+    def _embedding_to_cache(embedding: np.ndarray) -> bytes:
+        """将向量转换为缓存值（原始float32字节，比浮点列表的pickle小约6倍）"""
+        return np.asarray(embedding, dtype=np.float32).tobytes()
 
     def _get_cached_embedding(self, text: str) -> np.ndarray:
         """从缓存获取嵌入向量"""
@@ -68,11 +128,28 @@ class EmbeddingService:
             cached_data = cache.get(cache_key)
             if cached_data:
                 logger.debug(f"缓存命中: {text[:50]}...")
-                return np.array(cached_data, dtype=np.float32)
+                return self._embedding_from_cache(cached_data)
         except Exception as e:
             logger.warning(f"缓存读取失败: {e}")
         return None
 
+    def _get_cached_embeddings_many(self, texts: List[str]) -> Dict[int, np.ndarray]:
+        """一次批量读取多条文本的缓存向量，返回{文本下标: 向量}"""
+        if not self.enable_cache or not texts:
+            return {}
+
+        cache_keys = [self._get_cache_key(text) for text in texts]
+        try:
+            cached = cache.get_many(cache_keys)
+        except Exception as e:
+            logger.warning(f"缓存批量读取失败: {e}")
+            return {}
+
+        hits = {i: self._embedding_from_cache(cached[key]) for i, key in enumerate(cache_keys) if cached.get(key)}
+        if hits:
+            logger.debug(f"缓存命中{len(hits)}/{len(texts)}条")
+        return hits
+
     def _set_cached_embedding(self, text: str, embedding: np.ndarray):
         """设置嵌入向量到缓存"""
         if not self.enable_cache:
@@ -80,12 +157,38 @@ class EmbeddingService:
 
         cache_key = self._get_cache_key(text)
         try:
-            # 将numpy数组转换为列表存储
-            cache.set(cache_key, embedding.tolist(), timeout=self.cache_timeout)
+            cache.set(cache_key, self._embedding_to_cache(embedding), timeout=self.cache_timeout)
             logger.debug(f"缓存设置: {text[:50]}...")
         except Exception as e:
             logger.warning(f"缓存设置失败: {e}")
 
+    def _set_cached_embeddings_many(self, texts: List[str], embeddings: np.ndarray):
+        """一次批量写入多条文本的向量缓存"""
+        if not self.enable_cache or not texts:
+            return
+
+        try:
+            cache.set_many(
+                {
+                    self._get_cache_key(text): self._embedding_to_cache(embedding)
+                    for text, embedding in zip(texts, embeddings)
+                },
+                timeout=self.cache_timeout,
+            )
+        except Exception as e:
+            logger.warning(f"缓存批量设置失败: {e}")
+
+    def _decode_embedding(self, raw) -> np.ndarray:
+        """将API返回的单个向量（浮点列表或base64字符串）转换为float32数组"""
+        if isinstance(raw, str):
+            embedding = np.frombuffer(base64.b64decode(raw), dtype="<f4").astype(np.float32, copy=False)
+        else:
+            embedding = np.asarray(raw, dtype=np.float32)
+
+        if embedding.shape[0] != self.vector_dim:
+            raise ValueError(f"嵌入向量维度不匹配: 期望{self.vector_dim}，实际{embedding.shape[0]}")
+        return embedding
+
     @retry(
         max_tries=3,
         delay=1.5,
@@ -96,9 +199,7 @@ class EmbeddingService:
     def _get_embedding_from_api(self, text: str) -> np.ndarray:
         """从API获取嵌入向量（内部方法）"""
         if not self.api_key:
-            # 如果API密钥未设置，返回随机向量（仅用于测试）
-            logger.warning("使用随机向量替代真实嵌入（仅用于测试）")
-            return np.random.rand(self.vector_dim).astype("float32")
+            raise EmbeddingFailedError("DASHSCOPE_API_KEY未设置，无法获取嵌入向量")
 
         try:
             # 使用OpenAI兼容模式调用DashScope API获取嵌入向量
@@ -107,11 +208,11 @@ class EmbeddingService:
                 model=self.embedding_model_version,
                 input=text,
                 dimensions=self.vector_dim,
-                encoding_format="float",
+                encoding_format=self.encoding_format,
             )
 
             # 获取嵌入向量
-            embedding = np.array(response.data[0].embedding).astype("float32")
+            embedding = self._decode_embedding(response.data[0].embedding)
             logger.info(f"成功获取嵌入向量，维度: {len(embedding)}")
             return embedding
 
@@ -127,8 +228,54 @@ class EmbeddingService:
                 raise EmbeddingAPIError(f"API调用失败: {str(e)}")
 
             logger.exception(f"获取嵌入时发生异常: {str(e)}")
-            # 其他错误，返回随机向量（应急措施）
-            return np.random.rand(self.vector_dim).astype("float32")
+            # 其他错误不可重试，直接失败，避免随机向量污染缓存和索引
+            raise EmbeddingFailedError(f"获取嵌入失败: {str(e)}") from e
+
+    @retry(
+        max_tries=3,
+        delay=1.5,
+        backoff_factor=2.0,
+        exceptions=[EmbeddingAPIError, requests.exceptions.RequestException],
+        on_retry=log_retry,
+    )
+    def _get_embeddings_from_api(self, texts: List[str]) -> np.ndarray:
+        """一次API调用获取多条文本的嵌入向量（内部方法），返回形状为(len(texts), vector_dim)的数组"""
+        if not self.api_key:
+            raise EmbeddingFailedError("DASHSCOPE_API_KEY未设置，无法获取嵌入向量")
+
+        try:
+            logger.info(f"使用模型 {self.embedding_model_version} 批量获取{len(texts)}条嵌入向量")
+            response = self.client.embeddings.create(
+                model=self.embedding_model_version,
+                input=texts,
+                dimensions=self.vector_dim,
+                encoding_format=self.encoding_format,
+            )
+
+            if len(response.data) != len(texts):
+                raise ValueError(f"返回的嵌入向量数量不匹配: 期望{len(texts)}，实际{len(response.data)}")
+
+            # 直接写入预分配的数组，按返回的index还原输入顺序
+            embeddings = np.empty((len(texts), self.vector_dim), dtype=np.float32)
+            for item in response.data:
+                embeddings[item.index] = self._decode_embedding(item.embedding)
+            logger.info(f"成功获取{len(embeddings)}条嵌入向量，维度: {embeddings.shape[1]}")
+            return embeddings
+
+        except requests.exceptions.RequestException as e:
+            # 网络错误，可以重试
+            logger.error(f"网络请求错误: {str(e)}")
+            raise  # 让装饰器捕获并重试
+
+        except Exception as e:
+            if "rate limit" in str(e).lower() or "timeout" in str(e).lower():
+                # 速率限制或超时错误，可以重试
+                logger.error(f"API限制错误: {str(e)}")
+                raise EmbeddingAPIError(f"API调用失败: {str(e)}")
+
+            logger.exception(f"批量获取嵌入时发生异常: {str(e)}")
+            # 其他错误不可重试，直接失败，避免随机向量污染缓存和索引
+            raise EmbeddingFailedError(f"批量获取嵌入失败: {str(e)}") from e
 
     def get_embedding(self, text: str) -> np.ndarray:
         """
@@ -149,6 +296,60 @@ class EmbeddingService:
 
         return embedding
 
+    def get_embeddings(self, texts: List[str], batch_size: int = 10) -> np.ndarray:
+        """
+        批量获取文本的向量表示（带缓存优化）
+
+        先批量查询缓存，未命中的文本去重后按batch_size分批调用API（DashScope兼容接口每次最多10条），并缓存结果
+
+        Args:
+            texts: 文本列表
+            batch_size: 每次API调用的文本数
+
+        Returns:
+            形状为(len(texts), vector_dim)的float32数组，顺序与texts一致
+        """
+        embeddings = np.empty((len(texts), self.vector_dim), dtype=np.float32)
+
+        # 1. 一次批量读取缓存
+        cached = self._get_cached_embeddings_many(texts)
+        for i, cached_embedding in cached.items():
+            embeddings[i] = cached_embedding
+        missing = [i for i in range(len(texts)) if i not in cached]
+
+        # 2. 归一化后相同的未命中文本（重复的页眉、目录、标准条款等）只请求一次，其余位置复制结果
+        first_index = {}
+        unique_missing = []
+        duplicates = []
+        for i in missing:
+            source = first_index.setdefault(_normalize_for_cache(texts[i]), i)
+            if source == i:
+                unique_missing.append(i)
+            else:
+                duplicates.append((i, source))
+
+        # 3. 缓存未命中的文本分批从API获取，多个批次并发请求（API调用是I/O密集型），并批量缓存结果
+        batches = [unique_missing[start : start + batch_size] for start in range(0, len(unique_missing), batch_size)]
+
+        def fetch(batch_indices: List[int]) -> np.ndarray:
+            batch_texts = [texts[i] for i in batch_indices]
+            batch_embeddings = self._get_embeddings_from_api(batch_texts)
+            self._set_cached_embeddings_many(batch_texts, batch_embeddings)
+            return batch_embeddings
+
+        if len(batches) == 1:
+            embeddings[batches[0]] = fetch(batches[0])
+        elif batches:
+            max_workers = min(len(batches), getattr(settings, "EMBEDDING_MAX_CONCURRENCY", 4))
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embedding-api") as executor:
+                for batch_indices, batch_embeddings in zip(batches, executor.map(fetch, batches)):
+                    embeddings[batch_indices] = batch_embeddings
+
+        for i, source in duplicates:
+            embeddings[i] = embeddings[source]
+
+        return embeddings
+
     def clear_cache(self):
         """清空嵌入向量缓存"""
         try:
@@ -99,8 +99,8 @@ class HybridSearch:
             if not query_terms:
                 return {}
 
-            # 2. 获取候选chunk ID
-            candidate_chunk_ids = [result.chunk_index for result in vector_results]
+            # 2. 获取候选chunk ID（倒排索引按DocumentChunk主键关联，不能使用文档内的chunk_index）
+            candidate_chunk_ids = [result.chunk_id for result in vector_results if result.chunk_id is not None]
 
             if not candidate_chunk_ids:
                 return {}
@@ -189,7 +189,7 @@ class HybridSearch:
         score_dict = {}
 
         for i, doc in enumerate(vector_results):
-            score_dict[doc.chunk_index] = {
+            score_dict[doc.chunk_id] = {
                 "vector": vector_scores[i],
                 "bm25": 0.0,
                 "doc": doc
@@ -215,6 +215,7 @@ class HybridSearch:
                 content=doc.content,
                 score=combined_score,
                 chunk_index=doc.chunk_index,
+                chunk_id=doc.chunk_id,
                 embedding_model_version=doc.embedding_model_version,
                 rerank_score=None,
                 final_score=None,
@@ -1,13 +1,18 @@
 import numpy as np
 from loguru import logger
-from typing import Optional
+from typing import Any, Dict, List, Optional
 import os
+import threading
 from django.conf import settings
 
 
 class LocalEmbeddingService:
     """本地向量嵌入服务，使用sentence-transformers而不依赖外部API"""
 
+    # 进程内按模型名共享已加载的模型（推理线程安全），避免多个服务实例重复加载同一模型
+    _model_cache: Dict[str, Any] = {}
+    _model_cache_lock = threading.Lock()
+
     def __init__(self, embedding_model_version: Optional[str] = None):
         """
         初始化本地向量嵌入服务
@@ -49,25 +54,45 @@ class LocalEmbeddingService:
 
             self.SentenceTransformer = SentenceTransformer
 
-            # 加载模型
-            self._load_model()
+            # 加载模型（同一模型在进程内只加载一次）
+            with self._model_cache_lock:
+                cached_model = self._model_cache.get(self.embedding_model_version)
+                if cached_model is None:
+                    self._load_model()
+                    self._model_cache[self.embedding_model_version] = self.model
+                else:
+                    logger.info(f"复用已加载的模型: {self.embedding_model_version}")
+                    self.model = cached_model
+                    self.vector_dim = cached_model.get_sentence_embedding_dimension()
         except ImportError:
             logger.error("sentence-transformers未安装，请运行: pip install sentence-transformers")
             self.model = None
 
     def _load_model(self):
         """加载嵌入模型，优先使用本地缓存"""
+        self._configure_torch_threads()
+
         try:
             # 检查模型缓存目录
             os_cache_dir = os.environ.get("HF_HOME") or os.path.join(os.path.expanduser("~"), ".cache", "huggingface")
             logger.info(f"模型将缓存到: {os_cache_dir}")
 
+            # 推理后端："torch"（默认）、"onnx"或"openvino"；非torch后端首次加载时导出模型，导出结果保存在缓存目录中复用
+            backend = getattr(settings, "LOCAL_EMBEDDING_BACKEND", "torch").lower()
+            model_kwargs = {} if backend == "torch" else {"backend": backend}
+            export_dir = os.path.join(
+                os_cache_dir, f"sentence_transformers_{backend}", self.embedding_model_version.replace("/", "__")
+            )
+            exported = backend != "torch" and os.path.isdir(export_dir)
+            model_source = export_dir if exported else self.embedding_model_version
+
             # 首先尝试仅使用本地文件加载模型
-            logger.info(f"尝试从本地缓存加载模型: {self.embedding_model_version}")
+            logger.info(f"尝试从本地缓存加载模型: {model_source}，推理后端: {backend}")
             try:
                 self.model = self.SentenceTransformer(
-                    self.embedding_model_version,
+                    model_source,
                     local_files_only=True,  # 只使用本地缓存
+                    **model_kwargs,
                 )
                 logger.info("成功从本地缓存加载模型")
             except Exception as local_err:
@@ -76,9 +101,20 @@ class LocalEmbeddingService:
                 self.model = self.SentenceTransformer(
                     self.embedding_model_version,
                     cache_folder=os_cache_dir,  # 指定缓存目录
+                    **model_kwargs,
                 )
+                exported = False
                 logger.info("成功通过网络下载并加载模型")
 
+            if backend == "torch":
+                self._apply_inference_dtype()
+            elif not exported:
+                try:
+                    self.model.save_pretrained(export_dir)
+                    logger.info(f"已保存{backend}导出模型: {export_dir}")
+                except Exception as e:
+                    logger.warning(f"保存{backend}导出模型失败，下次加载将重新导出: {str(e)}")
+
             logger.info(f"模型加载成功，实际向量维度: {self.model.get_sentence_embedding_dimension()}")
 
             # 更新向量维度为模型的实际维度
@@ -88,6 +124,51 @@ class LocalEmbeddingService:
             self.model = None
             raise RuntimeError(f"无法加载嵌入模型: {str(e)}")
 
+    @staticmethod
+    def _configure_torch_threads():
+        """显式设置CPU推理线程数，避免部署环境中OMP_NUM_THREADS等变量把矩阵运算限制为单线程"""
+        try:
+            import torch
+        except ImportError:
+            return
+
+        num_threads = getattr(settings, "LOCAL_EMBEDDING_TORCH_THREADS", 0) or os.cpu_count() or 1
+        torch.set_num_threads(num_threads)
+        try:
+            # 进程内发生过并行算子调用后不能再修改inter-op线程数
+            torch.set_num_interop_threads(max(1, num_threads // 4))
+        except RuntimeError as e:
+            logger.debug(f"无法设置inter-op线程数: {str(e)}")
+        logger.info(f"嵌入模型CPU推理线程数: {num_threads}")
+
+    def _apply_inference_dtype(self):
+        """
+        按硬件选择推理精度：GPU使用bf16/fp16；CPU上开启LOCAL_EMBEDDING_QUANTIZE时对Linear层做INT8动态量化，
+        否则支持AMX的CPU使用bf16，其余保持fp32（encode输出统一转回float32）
+        """
+        try:
+            import torch
+        except ImportError:
+            return
+
+        if self.model.device.type == "cuda":
+            dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        elif getattr(settings, "LOCAL_EMBEDDING_QUANTIZE", False):
+            # 只量化Transformer主干的Linear层，池化和归一化层保持fp32
+            transformer = self.model[0]
+            transformer.auto_model = torch.ao.quantization.quantize_dynamic(
+                transformer.auto_model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            logger.info("嵌入模型已进行INT8动态量化（CPU推理）")
+            return
+        elif getattr(torch.cpu, "_is_amx_tile_supported", lambda: False)():
+            dtype = torch.bfloat16
+        else:
+            return
+
+        self.model.to(dtype)
+        logger.info(f"嵌入模型使用{dtype}推理，设备: {self.model.device}")
+
     def get_embedding(self, text: str) -> np.ndarray:
         """
         获取文本的向量表示
@@ -99,9 +180,7 @@ class LocalEmbeddingService:
             文本的向量表示
         """
         if not self.model:
-            # 如果模型未加载成功，返回随机向量
-            logger.warning("模型未加载，返回随机向量（仅用于测试）")
-            return np.random.rand(self.vector_dim).astype("float32")
+            raise RuntimeError("嵌入模型未加载，无法生成嵌入向量")
 
         try:
             # 使用本地模型生成嵌入
@@ -119,5 +198,41 @@ class LocalEmbeddingService:
 
         except Exception as e:
             logger.exception(f"生成嵌入向量时出错: {str(e)}")
-            # 错误时返回随机向量
-            return np.random.rand(self.vector_dim).astype("float32")
+            # 直接失败，避免随机向量污染索引
+            raise
+
+    def get_embeddings(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """
+        批量获取文本的向量表示，一次encode调用完成整批前向计算
+
+        Args:
+            texts: 文本列表
+            batch_size: 每次前向计算的文本数
+
+        Returns:
+            形状为(len(texts), vector_dim)的float32数组，顺序与texts一致
+        """
+        if not self.model:
+            raise RuntimeError("嵌入模型未加载，无法生成嵌入向量")
+
+        try:
+            # 重复文本只计算一次，再按原顺序展开
+            unique_texts = list(dict.fromkeys(texts))
+            logger.info(f"批量生成{len(texts)}条文本嵌入（去重后{len(unique_texts)}条）")
+            embeddings = self.model.encode(
+                unique_texts,
+                batch_size=batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            ).astype(np.float32, copy=False)
+            if len(unique_texts) == len(texts):
+                return embeddings
+
+            position = {text: i for i, text in enumerate(unique_texts)}
+            return embeddings[[position[text] for text in texts]]
+
+        except Exception as e:
+            logger.exception(f"批量生成嵌入向量时出错: {str(e)}")
+            # 直接失败，避免随机向量污染索引
+            raise
@@ -1,26 +1,61 @@
-import gc
+import functools
+import hashlib
+import itertools
 import threading
 import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Self
 
 from django.conf import settings
+from django.db import connection, transaction
 from django.db.models import F
 from pgvector.django import VectorField
 from loguru import logger
 
 from common.utils.cache_utils import RedisCache, cached
+from common.utils.retry_utils import RetryableError
 from qa.schemas.retrieval import DocumentSearchResultOut
 
 from ..models import Document, DocumentChunk
 from .embedding_factory import get_embedding_service
 
 
+def _search_result_tags(results: List[DocumentSearchResultOut]) -> List[str]:
+    """为搜索结果生成缓存标签：结果中出现的每个文档一个标签"""
+    return [f"vector_search:doc:{document_id}" for document_id in {r.id for r in results}]
+
+
+def _search_cache_key(prefix: str, query: str, top_k: int = 5, embedding_model_version=None) -> str:
+    """search_static的缓存键：位置/关键字参数得到同一个键，且包含实际使用的模型版本，避免不同模型的结果互相命中"""
+    model_version = embedding_model_version or settings.EMBEDDING_MODEL_VERSION
+    digest = hashlib.blake2b(query.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{prefix}:{model_version}:{top_k}:{digest}"
+
+
+# 进程内检索结果缓存的跨进程失效通知频道（Celery worker索引文档后，Web进程据此清空本地缓存）
+QUERY_CACHE_INVALIDATION_CHANNEL = "smartdocs:vector_search:invalidate"
+
+
+@functools.lru_cache(maxsize=1)
+def _query_embedding_executor() -> ThreadPoolExecutor:
+    """进程内共享的查询向量化线程池：嵌入API调用在后台进行，同时在当前线程检查数据库"""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-embedding")
+
+
 class VectorDBService:
     """向量数据库服务，使用PostgreSQL+pgvector存储和检索文档向量"""
 
     # 单例模式相关变量（使用字典存储不同模型版本的实例）
     _instances = {}
     _instance_lock = threading.Lock()
+    # 每个模型版本一把初始化锁，加载某个模型时不阻塞其他模型版本的实例获取
+    _instance_locks = defaultdict(threading.Lock)
+
+    # 进程内检索结果缓存：{(模型版本, top_k, 查询向量摘要): (过期时间, 结果)}，按LRU淘汰
+    _query_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+    _query_cache_lock = threading.RLock()
+    _query_cache_listener = None
 
     @classmethod
     def get_instance(cls, embedding_model_version=None) -> Self:
@@ -36,8 +71,16 @@ class VectorDBService:
         # 规范化模型版本，确保None使用默认值
         model_version = embedding_model_version or settings.EMBEDDING_MODEL_VERSION
 
-        # 使用锁保证线程安全
+        # 快速路径：实例已完成初始化时无需加锁（_initialized在_init完成后才置为True）
+        instance = cls._instances.get(model_version)
+        if instance is not None and getattr(instance, "_initialized", False):
+            return instance
+
+        # 全局锁只用于取出该模型版本的锁；用该版本的锁保证线程安全，加锁后重新检查
         with cls._instance_lock:
+            version_lock = cls._instance_locks[model_version]
+
+        with version_lock:
             # 如果该模型版本的实例不存在，则创建
             if model_version not in cls._instances:
                 logger.info(f"创建新的VectorDBService实例 (模型版本: {model_version})")
@@ -91,54 +134,55 @@ class VectorDBService:
                 logger.warning(f"文档{document.id}状态为failed，跳过索引")
                 return False
 
-            # 获取文档分块
-            chunks = DocumentChunk.objects.filter(document_id=document.id)
-
-            if not chunks.exists():
-                logger.warning(f"文档{document.id}没有分块，无法索引")
-                return False
-
-            # 分批处理文档块以减少内存使用
-            batch_size = 10
+            # 分批处理文档块：每批一次get_embeddings调用（API服务内部再按接口上限拆分并发请求）
+            batch_size = getattr(settings, "EMBEDDING_INDEX_BATCH_SIZE", 32)
+            total_chunks = 0
             total_vectors = 0
+            failed_embeddings = 0
 
-            for i in range(0, chunks.count(), batch_size):
-                batch_chunks = list(chunks[i : i + batch_size])
-                vectors_data = []
+            # 用一个流式游标逐批读取分块（只加载检索向量所需的字段），不把整个文档的分块一次载入内存
+            chunk_iter = (
+                DocumentChunk.objects.filter(document_id=document.id)
+                .only("id", "content")
+                .iterator(chunk_size=batch_size)
+            )
 
-                # 处理每个文档块
-                for chunk in batch_chunks:
-                    try:
-                        # 获取块文本向量
-                        vector = self.embedding_service.get_embedding(chunk.content)
-                        vectors_data.append((chunk.id, vector))
-                    except Exception as e:
-                        logger.error(f"处理文档块{chunk.id}时出错: {str(e)}")
+            for i in itertools.count(0, batch_size):
+                batch_chunks = list(itertools.islice(chunk_iter, batch_size))
+                if not batch_chunks:
+                    break
+                total_chunks += len(batch_chunks)
 
-                if not vectors_data:
+                # 获取失败的分块保持embedding为空，检索时会被跳过
+                embedded_chunks = self._embed_chunks(batch_chunks, i)
+                failed_embeddings += len(batch_chunks) - len(embedded_chunks)
+                if not embedded_chunks:
                     continue
 
-                # 批量更新向量到数据库
-                for chunk_id, vector in vectors_data:
-                    try:
-                        chunk = DocumentChunk.objects.get(id=chunk_id)
-                        chunk.embedding = vector
-                        chunk.save(update_fields=["embedding"])
-                    except DocumentChunk.DoesNotExist:
-                        logger.error(f"文档块{chunk_id}不存在")
-                    except Exception as e:
-                        logger.error(f"保存向量到数据库失败: {str(e)}")
+                # 一条UPDATE批量写入整批向量
+                try:
+                    DocumentChunk.objects.bulk_update(embedded_chunks, ["embedding"])
+                except Exception as e:
+                    logger.error(f"保存向量到数据库失败: {str(e)}")
+                    failed_embeddings += len(embedded_chunks)
+                    continue
 
-                total_vectors += len(vectors_data)
+                total_vectors += len(embedded_chunks)
 
-                # 每处理一批次，进行垃圾回收
-                gc.collect()
+                logger.info(f"已处理{total_chunks}个文档块")
 
-                logger.info(f"已处理{min(i + batch_size, chunks.count())}/{chunks.count()}个文档块")
+            if not total_chunks:
+                logger.warning(f"文档{document.id}没有分块，无法索引")
+                return False
 
             # 清除查询缓存
             self.clear_search_cache()
 
+            if failed_embeddings:
+                logger.warning(f"文档{document.id}有{failed_embeddings}个文档块未能获取向量，未被索引")
+            if not total_vectors:
+                logger.error(f"文档{document.id}所有文档块均未能获取向量")
+                return False
             logger.info(f"文档{document.id}的{total_vectors}个向量已成功索引")
             return True
 
@@ -146,86 +190,233 @@ class VectorDBService:
             logger.exception(f"索引文档{document.id}失败: {str(e)}")
             return False
 
+    def _embed_chunks(self, batch_chunks: List[DocumentChunk], offset: int) -> List[DocumentChunk]:
+        """
+        为一批文档块获取向量并写入chunk.embedding，返回成功获取向量的文档块
+
+        整批请求失败且不是重试耗尽的可重试错误时，逐条重新获取，避免个别文本导致整批失败
+        """
+        try:
+            vectors = self.embedding_service.get_embeddings([chunk.content for chunk in batch_chunks])
+        except Exception as e:
+            logger.error(f"获取第{offset + 1}-{offset + len(batch_chunks)}个文档块的向量时出错: {str(e)}")
+            if len(batch_chunks) == 1 or isinstance(e, RetryableError):
+                return []
+
+            logger.info("改为逐条获取该批文档块的向量")
+            embedded_chunks = []
+            for chunk in batch_chunks:
+                try:
+                    chunk.embedding = self.embedding_service.get_embeddings([chunk.content])[0]
+                    embedded_chunks.append(chunk)
+                except Exception as item_error:
+                    logger.error(f"获取文档块{chunk.id}的向量失败: {str(item_error)}")
+            return embedded_chunks
+
+        for chunk, vector in zip(batch_chunks, vectors):
+            chunk.embedding = vector
+        return batch_chunks
+
     def search(self, query: str, top_k: int = 5) -> List[DocumentSearchResultOut]:
         """根据查询文本搜索相关文档块（使用pgvector）"""
         try:
-            # 检查是否有索引向量
-            indexed_count = DocumentChunk.objects.filter(embedding__isnull=False).count()
-            if indexed_count == 0:
+            # 将查询文本转换为向量（后台线程），与检查是否有索引向量并行
+            embedding_future = _query_embedding_executor().submit(self.embedding_service.get_embedding, query)
+
+            if not DocumentChunk.objects.filter(embedding__isnull=False).exists():
+                embedding_future.cancel()
                 logger.warning("向量索引为空，无法进行搜索")
                 return []
 
-            # 将查询文本转换为向量
-            query_vector = self.embedding_service.get_embedding(query)
+            query_vector = embedding_future.result()
+            return self._search_by_vector(query_vector, top_k)
 
-            # 使用pgvector的<=>操作符进行向量相似度搜索
-            # 直接使用Django ORM的 __isnull 过滤和原生查询
-            from django.db.models import Case, When, Value, FloatField
-            from pgvector.django import CosineDistance
+        except Exception as e:
+            logger.exception(f"搜索失败: {str(e)}")
+            return []
 
-            # 使用余弦距离搜索
-            results_qs = (
-                DocumentChunk.objects
-                .filter(embedding__isnull=False)
-                .annotate(distance=CosineDistance("embedding", query_vector))
-                .order_by("distance")[:top_k]
-            )
+    def search_batch(self, queries: List[str], top_k: int = 5) -> List[List[DocumentSearchResultOut]]:
+        """
+        批量搜索：一次批量嵌入所有查询文本，再逐条检索
 
-            # 获取检索结果
-            results = []
-            version_mismatch_count = 0
+        Args:
+            queries: 查询文本列表
+            top_k: 每条查询返回的结果数量
 
-            for chunk in results_qs:
-                try:
-                    # 检查关联的文档
-                    document = Document.objects.get(id=chunk.document_id)
-
-                    # 如果文档已被删除，跳过
-                    if document.is_deleted:
-                        continue
-
-                    # 如果文档使用的嵌入模型与当前不同，记录并跳过
-                    if document.embedding_model_version != self.embedding_model_version:
-                        version_mismatch_count += 1
-                        continue
-
-                    # 构建完整的内容：包含标题上下文
-                    full_content = chunk.content
-                    if chunk.section_path:
-                        full_content = f"[{chunk.section_path}]\n\n{full_content}"
-
-                    # 计算相似度分数（pgvector返回的是距离，需要转换为相似度）
-                    # 余弦距离范围是 0-2，转换为相似度 1-0
-                    similarity_score = 1 - (chunk.distance / 2)
-
-                    results.append(
-                        DocumentSearchResultOut(
-                            id=document.id,
-                            title=document.title,
-                            content=full_content,
-                            score=float(similarity_score),
-                            chunk_index=chunk.chunk_index,
-                            embedding_model_version=document.embedding_model_version,
-                            rerank_score=None,
-                            final_score=None,
-                            rerank_method=None,
-                        )
-                    )
-                except (DocumentChunk.DoesNotExist, Document.DoesNotExist):
-                    continue
+        Returns:
+            与queries顺序一致的检索结果列表
+        """
+        if not queries:
+            return []
 
-            if version_mismatch_count > 0:
-                logger.warning(f"跳过了{version_mismatch_count}个模型版本不匹配的文档块")
+        try:
+            embedding_future = _query_embedding_executor().submit(self.embedding_service.get_embeddings, queries)
 
-            logger.info(f"检索完成，返回{len(results)}个结果")
-            return results
+            if not DocumentChunk.objects.filter(embedding__isnull=False).exists():
+                embedding_future.cancel()
+                logger.warning("向量索引为空，无法进行搜索")
+                return [[] for _ in queries]
 
+            query_vectors = embedding_future.result()
         except Exception as e:
-            logger.exception(f"搜索失败: {str(e)}")
-            return []
+            logger.exception(f"批量搜索失败: {str(e)}")
+            return [[] for _ in queries]
+
+        results = []
+        for query_vector in query_vectors:
+            try:
+                results.append(self._search_by_vector(query_vector, top_k))
+            except Exception as e:
+                logger.exception(f"搜索失败: {str(e)}")
+                results.append([])
+        return results
+
+    @classmethod
+    def _query_cache_get(cls, key: tuple):
+        """读取未过期的检索结果缓存，命中时移到LRU末尾"""
+        with cls._query_cache_lock:
+            entry = cls._query_cache.get(key)
+            if entry is None:
+                return None
+            expires_at, results = entry
+            if expires_at <= time.monotonic():
+                del cls._query_cache[key]
+                return None
+            cls._query_cache.move_to_end(key)
+            return list(results)
+
+    @classmethod
+    def _query_cache_put(cls, key: tuple, results: List[DocumentSearchResultOut]):
+        """写入检索结果缓存，超出容量时淘汰最久未使用的条目"""
+        ttl = getattr(settings, "VECTOR_QUERY_CACHE_TTL", 300)
+        max_size = getattr(settings, "VECTOR_QUERY_CACHE_SIZE", 2000)
+        cls._ensure_query_cache_listener()
+        with cls._query_cache_lock:
+            cls._query_cache[key] = (time.monotonic() + ttl, list(results))
+            cls._query_cache.move_to_end(key)
+            while len(cls._query_cache) > max_size:
+                cls._query_cache.popitem(last=False)
+
+    @classmethod
+    def clear_query_cache(cls):
+        """清空进程内检索结果缓存"""
+        with cls._query_cache_lock:
+            cls._query_cache.clear()
+
+    @classmethod
+    def _ensure_query_cache_listener(cls):
+        """首次写入进程内缓存时启动后台线程订阅失效通知，每个进程只启动一次"""
+        if cls._query_cache_listener is not None:
+            return
+        with cls._query_cache_lock:
+            if cls._query_cache_listener is None:
+                cls._query_cache_listener = threading.Thread(
+                    target=cls._listen_query_cache_invalidation, name="vector-cache-invalidation", daemon=True
+                )
+                cls._query_cache_listener.start()
+
+    @classmethod
+    def _listen_query_cache_invalidation(cls):
+        """订阅失效通知并清空进程内缓存；连接断开后重新订阅，期间可能漏掉通知，因此(重新)订阅成功时也清空一次"""
+        while True:
+            try:
+                pubsub = RedisCache.get_pubsub()
+                pubsub.subscribe(QUERY_CACHE_INVALIDATION_CHANNEL)
+                while True:
+                    # 带超时轮询而不是listen()阻塞读取，避免空闲时触发Redis客户端的读超时而反复重连
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] in ("message", "subscribe"):
+                        cls.clear_query_cache()
+            except Exception as e:
+                logger.warning(f"向量检索缓存失效通知订阅中断，5秒后重试: {str(e)}")
+                cls.clear_query_cache()
+                time.sleep(5)
+
+    def _search_by_vector(self, query_vector, top_k: int) -> List[DocumentSearchResultOut]:
+        """按查询向量检索最相近的文档块，相同查询向量在TTL内直接返回进程内缓存的结果"""
+        cache_key = (
+            self.embedding_model_version,
+            top_k,
+            hashlib.blake2b(query_vector.tobytes(), digest_size=16).digest(),
+        )
+        cached_results = self._query_cache_get(cache_key)
+        if cached_results is not None:
+            logger.debug("向量检索命中进程内缓存")
+            return cached_results
+
+        # 使用pgvector的<=>操作符进行向量相似度搜索
+        # 直接使用Django ORM的 __isnull 过滤和原生查询
+        from django.db.models import Value
+        from pgvector.django import CosineDistance
+
+        # 只检索属于当前嵌入模型版本且未删除文档的分块：在SQL中过滤，不在Python中丢弃结果
+        current_documents = Document.objects.filter(embedding_model_version=self.embedding_model_version)
+
+        # 多取一些候选，结果组装阶段再截断为top_k
+        fetch_k = top_k * getattr(settings, "VECTOR_SEARCH_OVERFETCH", 2)
+
+        # 使用余弦距离搜索（走embedding列上的HNSW索引）；
+        # 相似度分数在SQL中一并算出：余弦距离范围是 0-2，转换为相似度 1-0
+        results_qs = (
+            DocumentChunk.objects
+            .filter(embedding__isnull=False, document_id__in=current_documents.values("id"))
+            .only("id", "document_id", "content", "chunk_index", "section_path")
+            .annotate(distance=CosineDistance("embedding", query_vector))
+            .annotate(similarity=Value(1.0) - F("distance") / Value(2.0))
+            .order_by("distance")[:fetch_k]
+        )
+
+        # 获取检索结果：一次查询取回命中块所属的全部文档（默认管理器已排除软删除的文档）
+        if connection.vendor == "postgresql":
+            # HNSW扫描最多只返回ef_search个候选，之后才应用上面的WHERE过滤（模型版本/已删除文档），
+            # 被过滤掉的候选不会再补回；因此把ef_search提高到不小于fetch_k，使过滤后仍留有足够的行
+            ef_search = max(getattr(settings, "HNSW_EF_SEARCH", 40), fetch_k)
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("SET LOCAL hnsw.ef_search = %s", [ef_search])
+                chunks = list(results_qs)
+        else:
+            chunks = list(results_qs)
+        documents = current_documents.only("id", "title", "embedding_model_version").in_bulk(
+            {chunk.document_id for chunk in chunks}
+        )
+
+        results = []
+
+        for chunk in chunks:
+            if len(results) == top_k:
+                break
+
+            # 文档在两次查询之间被删除或重新索引，跳过
+            document = documents.get(chunk.document_id)
+            if document is None:
+                continue
+
+            # 构建完整的内容：包含标题上下文
+            full_content = chunk.content
+            if chunk.section_path:
+                full_content = f"[{chunk.section_path}]\n\n{full_content}"
+
+            results.append(
+                DocumentSearchResultOut(
+                    id=document.id,
+                    title=document.title,
+                    content=full_content,
+                    score=chunk.similarity,
+                    chunk_index=chunk.chunk_index,
+                    chunk_id=chunk.id,
+                    embedding_model_version=document.embedding_model_version,
+                    rerank_score=None,
+                    final_score=None,
+                    rerank_method=None,
+                )
+            )
+
+        logger.info(f"检索完成，返回{len(results)}个结果")
+        self._query_cache_put(cache_key, results)
+        return results
 
-    @cached(prefix="vector_search", timeout=60 * 60)
     @staticmethod
+    @cached(prefix="vector_search", timeout=60 * 60, key_func=_search_cache_key, tags_func=_search_result_tags)
     def search_static(query: str, top_k: int = 5, embedding_model_version=None) -> List[DocumentSearchResultOut]:
         """
         静态方法版本的搜索，方便缓存和共享
@@ -241,10 +432,24 @@ class VectorDBService:
         instance = VectorDBService.get_instance(embedding_model_version=embedding_model_version)
         return instance.search(query, top_k)
 
+    @staticmethod
+    def invalidate_document_cache(document_id: int) -> int:
+        """只清除结果中包含指定文档的向量搜索缓存（进程内缓存不按文档区分，整体清空）"""
+        VectorDBService.clear_query_cache()
+        RedisCache.publish(QUERY_CACHE_INVALIDATION_CHANNEL, document_id)
+        count = RedisCache.invalidate_tag(f"vector_search:doc:{document_id}")
+
+        if count:
+            logger.info(f"已清除{count}个包含文档{document_id}的向量搜索缓存")
+
+        return count
+
     @staticmethod
     def clear_search_cache():
         """清除所有向量搜索缓存"""
-        pattern = "smartdocs:cache:vector_search:*"
+        VectorDBService.clear_query_cache()
+        RedisCache.publish(QUERY_CACHE_INVALIDATION_CHANNEL, "all")
+        pattern = "vector_search:*"
         count = RedisCache.clear_pattern(pattern)
 
         if count:
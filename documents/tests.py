@@ -1,3 +1,245 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from common.utils.cache_utils import RedisCache, cached
+from qa.schemas.retrieval import DocumentSearchResultOut
+
+from .models import DocumentChunk
+from .services import document_processor
+from .services.document_processor import DocumentProcessor, _copy_value
+from .services.hierarchical_chunking import TitleExtractor
+from .services.vector_db_service import VectorDBService, _search_result_tags
+
+
+def _make_processor() -> DocumentProcessor:
+    """创建不初始化向量数据库服务的文档处理器，分块相关方法不依赖它"""
+    processor = DocumentProcessor.__new__(DocumentProcessor)
+    processor.embedding_model_version = "test-model"
+    processor.max_content_size = 5 * 1024 * 1024
+    return processor
+
+
+def _chunk_whole_text(processor: DocumentProcessor, text: str) -> list:
+    """原先基于完整文本的分块+标题元数据算法，作为流式分块的对照"""
+    lines = text.split("\n")
+    title_positions = []
+    current_pos = 0
+    for line in lines:
+        title_info = TitleExtractor.extract_title(line)
+        if title_info:
+            title_positions.append((current_pos, *title_info))
+        current_pos += len(line) + 1
+
+    results = []
+    for chunk_text in processor._chunk_text(text):
+        chunk_pos = max(text.find(chunk_text), 0)
+        title_stack = []
+        for pos, title, level in title_positions:
+            if pos >= chunk_pos:
+                break
+            title_stack = [(t, lvl) for t, lvl in title_stack if lvl < level]
+            title_stack.append((title, level))
+
+        results.append(
+            {
+                "content": chunk_text,
+                "title": title_stack[-1][0] if title_stack else "",
+                "section_path": " > ".join(t for t, _ in title_stack),
+                "hierarchy_level": title_stack[-1][1] if title_stack else 0,
+            }
+        )
+    return results
+
+
+def _heading_fixture() -> str:
+    """带多级标题的长文本（超过流式分块的窗口大小），每句内容唯一"""
+    sections = []
+    for chapter in range(1, 9):
+        sections.append(f"# 第{chapter}章 概述{chapter}")
+        for section in range(1, 7):
+            sections.append(f"## {chapter}.{section} 小节{chapter}-{section}")
+            for para in range(6):
+                sentences = "".join(
+                    f"这是第{chapter}章第{section}节第{para}段的第{i}句说明文字，用于检验分块边界。" for i in range(8)
+                )
+                sections.append(sentences)
+    return "\n\n".join(sections)
+
+
+class StreamingChunkerTests(SimpleTestCase):
+    """流式分块与原先整篇分块结果一致"""
+
+    def test_stream_matches_whole_text_chunker(self):
+        processor = _make_processor()
+        text = _heading_fixture()
+        assert len(text) > 64 * 1000
+
+        # 按不规则大小切分输入片段，覆盖标题行跨片段的情况
+        pieces = [text[i : i + 777] for i in range(0, len(text), 777)]
+        streamed = list(processor._chunk_and_extract_metadata(iter(pieces)))
+
+        assert streamed == _chunk_whole_text(processor, text)
+
+    def test_section_path_follows_headings(self):
+        processor = _make_processor()
+        text = "# 第一章 总则\n\n" + "总则内容。" * 50 + "\n\n## 1.1 范围\n\n" + "范围内容。" * 50
+
+        chunks = list(processor._chunk_and_extract_metadata(iter([text])))
+
+        assert chunks[-1]["section_path"] == "第一章 总则 > 1.1 范围"
+        assert chunks[-1]["title"] == "1.1 范围"
+
+
+class CopyChunksTests(SimpleTestCase):
+    """COPY文本格式的行内容"""
+
+    def test_copy_value_escapes_control_characters(self):
+        assert _copy_value(None) == "\\N"
+        assert _copy_value(3) == "3"
+        assert _copy_value("a\tb\nc\rd\\e") == "a\\tb\\nc\\rd\\\\e"
+
+    def test_bulk_copy_rows_and_primary_keys(self):
+        processor = _make_processor()
+        document = mock.Mock(id=7)
+        chunks = [
+            DocumentChunk(
+                document_id=7,
+                content="第一行\t制表符\n第二行",
+                chunk_index=0,
+                embedding_model_version="test-model",
+                title=None,
+                section_path=None,
+                hierarchy_level=0,
+                parent_chunk_index=None,
+            ),
+            DocumentChunk(
+                document_id=7,
+                content="反斜杠\\结尾",
+                chunk_index=1,
+                embedding_model_version="test-model",
+                title="标题",
+                section_path="章 > 节",
+                hierarchy_level=2,
+                parent_chunk_index=0,
+            ),
+        ]
+
+        copied = {}
+
+        def copy_expert(sql, buf):
+            copied["sql"] = sql
+            copied["data"] = buf.getvalue()
+
+        fake_connection = mock.MagicMock()
+        fake_connection.ops.quote_name = lambda name: f'"{name}"'
+        fake_connection.cursor.return_value.__enter__.return_value.copy_expert.side_effect = copy_expert
+
+        with (
+            mock.patch.object(document_processor, "connection", fake_connection),
+            mock.patch.object(DocumentChunk, "objects") as objects,
+        ):
+            objects.filter.return_value.values_list.return_value = [(0, 101), (1, 102)]
+            created = processor._bulk_copy_chunks(document, chunks)
+
+        assert copied["sql"].startswith(f'COPY "{DocumentChunk._meta.db_table}" ("document_id", "content"')
+        assert copied["data"] == (
+            "7\t第一行\\t制表符\\n第二行\t0\ttest-model\t\\N\t\\N\t0\t\\N\n"
+            "7\t反斜杠\\\\结尾\t1\ttest-model\t标题\t章 > 节\t2\t0\n"
+        )
+        assert [chunk.id for chunk in created] == [101, 102]
+        assert not created[0]._state.adding
+
+    def test_falls_back_to_bulk_create_without_psycopg2(self):
+        processor = _make_processor()
+        document = mock.Mock(id=7)
+
+        with (
+            mock.patch.object(DocumentProcessor, "_supports_copy_expert", return_value=False),
+            mock.patch.object(DocumentProcessor, "_delete_existing_chunks"),
+            mock.patch.object(DocumentProcessor, "_bulk_copy_chunks") as bulk_copy,
+            mock.patch.object(document_processor.IndexBuilder, "build_index_for_chunk"),
+            mock.patch.object(document_processor.transaction, "atomic"),
+            mock.patch.object(DocumentChunk, "objects") as objects,
+        ):
+            objects.bulk_create.side_effect = lambda objs, batch_size: objs
+            processor._process_chunks(document, iter(["一段足够长的正文内容。"]))
+
+        bulk_copy.assert_not_called()
+        objects.bulk_create.assert_called_once()
+
+
+class _FakeRedis:
+    """最小的内存Redis替身：django缓存和原始客户端共用同一个存储"""
+
+    default_timeout = 300
+
+    def __init__(self):
+        self.store = {}
+
+    # django cache接口
+    def make_key(self, key):
+        return f"smartdocs:1:{key}"
+
+    def get(self, key, default=None):
+        return self.store.get(self.make_key(key), default)
+
+    def set(self, key, value, timeout=None):
+        self.store[self.make_key(key)] = value
+
+    # redis客户端接口
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+    def sadd(self, key, member):
+        self.store.setdefault(key, set()).add(member)
+
+    def expire(self, key, seconds):
+        pass
+
+    def smembers(self, key):
+        return set(self.store.get(key, set()))
+
+    def unlink(self, *keys):
+        for key in keys:
+            self.store.pop(key, None)
+
+    def publish(self, channel, message):
+        return 0
+
+
+def _result(document_id: int) -> DocumentSearchResultOut:
+    return DocumentSearchResultOut(id=document_id, title=f"文档{document_id}", content="内容", score=0.9, chunk_index=0)
+
+
+class SearchCacheTagTests(SimpleTestCase):
+    """按文档标签失效只删除包含该文档的搜索缓存"""
+
+    def test_invalidate_document_removes_only_tagged_entries(self):
+        fake = _FakeRedis()
+        responses = {"q1": [_result(1), _result(2)], "q2": [_result(2)], "q3": [_result(3)]}
+
+        @cached(prefix="vector_search", timeout=60, tags_func=_search_result_tags)
+        def search(query):
+            return responses[query]
+
+        with (
+            mock.patch("common.utils.cache_utils.cache", fake),
+            mock.patch.object(RedisCache, "get_redis_client", return_value=fake),
+        ):
+            for query in responses:
+                search(query)
+            keys = {query: fake.make_key(RedisCache.get_cache_key("vector_search", query)) for query in responses}
+            assert all(key in fake.store for key in keys.values())
+
+            removed = VectorDBService.invalidate_document_cache(2)
+
+        assert removed == 2
+        assert keys["q1"] not in fake.store
+        assert keys["q2"] not in fake.store
+        assert keys["q3"] in fake.store
+        assert fake.make_key("tag:vector_search:doc:2") not in fake.store
+        assert fake.make_key("tag:vector_search:doc:3") in fake.store
@@ -32,6 +32,7 @@ class DocumentSearchResultOut(Schema):
     content: str
     score: float  # 原始相关性分数
     chunk_index: int
+    chunk_id: Optional[int] = None  # 文档块主键，用于与倒排索引等按chunk_id关联的数据对齐
     embedding_model_version: Optional[str] = None
     rerank_score: Optional[float] = None  # 重排序分数
     final_score: Optional[float] = None  # 最终分数（结合原始分数和重排序分数）
@@ -42,6 +42,7 @@ class RerankerService:
             content=original_doc.content,
             score=original_doc.score,
             chunk_index=original_doc.chunk_index,
+            chunk_id=original_doc.chunk_id,
             embedding_model_version=original_doc.embedding_model_version,
             rerank_score=rerank_score,
             final_score=final_score,
@@ -205,6 +206,7 @@ class RerankerService:
                                 content=original_doc.content,
                                 score=original_doc.score,
                                 chunk_index=original_doc.chunk_index,
+                                chunk_id=original_doc.chunk_id,
                                 embedding_model_version=original_doc.embedding_model_version,
                                 rerank_score=rerank_score,
                                 final_score=final_score,
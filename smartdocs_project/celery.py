@@ -1,5 +1,7 @@
+import gc
 import os
 from celery import Celery
+from celery.signals import worker_init
 
 # 设置默认Django settings模块
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "smartdocs_project.settings")
@@ -30,6 +32,15 @@ app.conf.update(
 app.autodiscover_tasks()
 
 
+@worker_init.connect
+def tune_gc_thresholds(**kwargs):
+    """调高分代GC阈值，避免文档处理时大量短生命周期对象频繁触发全量回收"""
+    from django.conf import settings
+
+    thresholds = getattr(settings, "WORKER_GC_THRESHOLDS", (100_000, 50, 50))
+    gc.set_threshold(*thresholds)
+
+
 # 设置Celery任务状态更新回调
 @app.task(bind=True)
 def debug_task(self):
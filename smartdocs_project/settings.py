@@ -161,6 +161,13 @@ MEDIA_ROOT = BASE_DIR / "media"
 # 文件上传配置
 MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", 10 * 1024 * 1024))  # 默认10MB
 
+# 文档解析配置
+# PDF页数达到该值时按页段并行提取文本，PDF_EXTRACT_WORKERS为0时使用CPU核数
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "50"))
+PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", "0"))
+# 文档分块入库时每批bulk_create的行数
+DOCUMENT_CHUNK_BULK_BATCH_SIZE = int(os.environ.get("DOCUMENT_CHUNK_BULK_BATCH_SIZE", "1000"))
+
 # 千问API配置
 QWEN_API_KEY = os.environ.get("QWEN_API_KEY", "")
 DASHSCOPE_API_KEY = os.environ.get("DASHSCOPE_API_KEY", "")
@@ -172,6 +179,16 @@ EMBEDDING_SERVICE_TYPE = os.environ.get("EMBEDDING_SERVICE_TYPE", "api")
 # API嵌入模型配置（当 EMBEDDING_SERVICE_TYPE='api' 时使用）
 EMBEDDING_MODEL_VERSION = os.environ.get("EMBEDDING_MODEL_VERSION", "text-embedding-v4")
 EMBEDDING_MODEL_DIMENSIONS = 1024
+# 嵌入API的向量返回格式: "float" 或 "base64"（base64响应更小，需服务端支持）
+EMBEDDING_ENCODING_FORMAT = os.environ.get("EMBEDDING_ENCODING_FORMAT", "float")
+# 单次批量获取嵌入时并发的API请求数上限
+EMBEDDING_MAX_CONCURRENCY = int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", "4"))
+# 建立向量索引时每次get_embeddings调用处理的文档块数
+EMBEDDING_INDEX_BATCH_SIZE = int(os.environ.get("EMBEDDING_INDEX_BATCH_SIZE", "32"))
+# pgvector HNSW检索的候选列表大小（越大召回率越高、查询越慢，pgvector默认40）
+HNSW_EF_SEARCH = int(os.environ.get("HNSW_EF_SEARCH", "40"))
+# 向量检索多取的倍数：HNSW扫描后才按模型版本/删除状态过滤，多取候选以保证结果数足够
+VECTOR_SEARCH_OVERFETCH = int(os.environ.get("VECTOR_SEARCH_OVERFETCH", "2"))
 
 # 本地嵌入模型配置（当 EMBEDDING_SERVICE_TYPE='local' 时使用）
 # 支持的模型及其维度:
@@ -182,6 +199,12 @@ EMBEDDING_MODEL_DIMENSIONS = 1024
 # - BAAI/bge-large-zh-v1.5: 1024维，中文优先，最佳质量
 # - paraphrase-multilingual-MiniLM-L12-v2: 384维，多语言
 LOCAL_EMBEDDING_MODEL = os.environ.get("LOCAL_EMBEDDING_MODEL", "BAAI/bge-large-zh-v1.5")
+# 本地嵌入模型推理后端：torch（默认）、onnx、openvino（后两者需安装optimum对应扩展）
+LOCAL_EMBEDDING_BACKEND = os.environ.get("LOCAL_EMBEDDING_BACKEND", "torch")
+# CPU推理时对本地嵌入模型做INT8动态量化（模型更小、推理更快，向量有轻微精度损失）
+LOCAL_EMBEDDING_QUANTIZE = os.environ.get("LOCAL_EMBEDDING_QUANTIZE", "False").lower() == "true"
+# 本地嵌入模型CPU推理线程数，0表示使用CPU核数
+LOCAL_EMBEDDING_TORCH_THREADS = int(os.environ.get("LOCAL_EMBEDDING_TORCH_THREADS", "0"))
 
 # 注意：text-embedding-v4是OpenAI API模型，不是HuggingFace模型
 # 确保在使用本地嵌入服务时不使用API模型名称
@@ -195,6 +218,9 @@ QA_RETRIEVAL_CACHE_TIMEOUT = int(os.environ.get("QA_RETRIEVAL_CACHE_TIMEOUT", "3
 
 # 向量库配置
 VECTOR_STORE_PATH = os.environ.get("VECTOR_STORE_PATH", str(BASE_DIR / "vector_store"))
+# 进程内向量检索结果缓存（按查询向量摘要命中），条目数上限和过期秒数
+VECTOR_QUERY_CACHE_SIZE = int(os.environ.get("VECTOR_QUERY_CACHE_SIZE", "2000"))
+VECTOR_QUERY_CACHE_TTL = int(os.environ.get("VECTOR_QUERY_CACHE_TTL", "300"))
 
 # 确保向量库目录存在
 
@@ -242,6 +268,10 @@ CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30分钟超时限制
+# Worker分代GC阈值(gen0, gen1, gen2)，调高gen0以减少处理大文档时的回收次数
+WORKER_GC_THRESHOLDS = tuple(
+    int(x) for x in os.environ.get("WORKER_GC_THRESHOLDS", "100000,50,50").split(",")
+)
 
 
 INSTALLED_APPS += [